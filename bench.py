@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# This code is licensed under the Gnu Public License
+# version 3 or later.
+#
+# Benchmarks for collects.py
+#
+# Each benchmark runs a batch of operations several times; the time
+# per operation of each batch gives the percentiles, and the median
+# gives operations per second.  Results can be saved as JSON, and two
+# saved runs compared to spot regressions.
+#
+import argparse
+import atexit
+import json
+import os
+from datetime import date, timedelta
+from os import path
+from platform import python_version
+from subprocess import DEVNULL, Popen, run
+from sys import executable, exit
+from tempfile import mkdtemp
+from time import perf_counter, sleep
+
+import collects
+
+COLLECTS = path.join(path.dirname(path.abspath(__file__)), "collects.py")
+CLIENT = path.join(path.dirname(path.abspath(__file__)), "collects_client.py")
+
+def _days(year):
+    first = date(year, 1, 1)
+    return [first + timedelta(days = i) for i in range(365)]
+
+def bench_calc_easter():
+    years = range(1583, 10000)
+    def batch():
+        for y in years:
+            collects.calc_easter(y)
+    return batch, len(years)
+
+def bench_church_date():
+    days = _days(2021)
+    def batch():
+        for d in days:
+            collects.church_date(d)
+    return batch, len(days)
+
+def bench_church_date_nospecials():
+    days = _days(2021)
+    def batch():
+        for d in days:
+            collects.church_date(d, incspecials = False)
+    return batch, len(days)
+
+def bench_church_date_cold():
+    "church_date() on years that aren't cached yet."
+    days = [d for y in range(2000, 2010) for d in _days(y)]
+    def batch():
+        collects.clear_year_cache()
+        for d in days:
+            collects.church_date(d)
+    return batch, len(days)
+
+def bench_collect_for_year():
+    days = _days(2021)
+    def batch():
+        for d in days:
+            collects.collect_for(d)
+    return batch, len(days)
+
+def _cli(*args):
+    def batch():
+        run([executable, COLLECTS] + list(args), stdout = DEVNULL, check = True)
+    return batch, 1
+
+def bench_startup():
+    "Bare no-argument invocation in a fresh interpreter, as from cron."
+    return _cli()
+
+def bench_cli_dates():
+    "Invocation with a dozen ISO dates."
+    return _cli(*[date(2021, m, 1).isoformat() for m in range(1, 13)])
+
+_daemon_env = None
+
+def _client(*args):
+    "Runs collects_client.py against a daemon started for the benchmarks."
+    global _daemon_env
+    if _daemon_env is None:
+        socket = path.join(mkdtemp(), "collects.sock")
+        daemon = Popen([executable, COLLECTS, "daemon", "--socket", socket])
+        atexit.register(daemon.terminate)
+        deadline = perf_counter() + 10
+        while not path.exists(socket):
+            if daemon.poll() is not None:
+                exit("collects.py daemon exited with status %d" % daemon.returncode)
+            if perf_counter() > deadline:
+                exit("collects.py daemon didn't start within 10s")
+            sleep(0.01)
+        _daemon_env = dict(os.environ, COLLECTS_SOCKET = socket)
+    def batch():
+        run([executable, CLIENT] + list(args), stdout = DEVNULL, check = True,
+            env = _daemon_env)
+    return batch, 1
+
+def bench_daemon_startup():
+    "As startup, through collects_client.py and a running daemon."
+    return _client()
+
+def bench_daemon_cli_dates():
+    "As cli_dates, through collects_client.py and a running daemon."
+    return _client(*[date(2021, m, 1).isoformat() for m in range(1, 13)])
+
+benchmarks = {
+    "calc_easter": bench_calc_easter,
+    "church_date": bench_church_date,
+    "church_date_nospecials": bench_church_date_nospecials,
+    "church_date_cold": bench_church_date_cold,
+    "collect_for_year": bench_collect_for_year,
+    "startup": bench_startup,
+    "cli_dates": bench_cli_dates,
+    "daemon_startup": bench_daemon_startup,
+    "daemon_cli_dates": bench_daemon_cli_dates,
+}
+
+def percentile(sorted_values, p):
+    "Nearest-rank percentile of an already sorted list."
+    i = max(0, min(len(sorted_values) - 1,
+                   round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[i]
+
+def measure(name, repeat):
+    batch, ops = benchmarks[name]()
+    batch() # warm up
+    per_op = []
+    for _ in range(repeat):
+        t = perf_counter()
+        batch()
+        per_op.append((perf_counter() - t) / ops)
+    per_op.sort()
+    median = percentile(per_op, 50)
+    return {
+        "ops": ops,
+        "repeat": repeat,
+        "ops_per_sec": 1 / median,
+        "p50_us": median * 1e6,
+        "p90_us": percentile(per_op, 90) * 1e6,
+        "p99_us": percentile(per_op, 99) * 1e6,
+    }
+
+def report(results):
+    print("%-24s %14s %12s %12s %12s" %
+          ("benchmark", "ops/sec", "p50 us", "p90 us", "p99 us"))
+    for name, r in results.items():
+        print("%-24s %14.1f %12.2f %12.2f %12.2f" %
+              (name, r["ops_per_sec"], r["p50_us"], r["p90_us"], r["p99_us"]))
+
+def compare(old_path, new_path, threshold):
+    """Prints the change in median time for each benchmark in both runs.
+    Returns true if any got slower by more than threshold percent."""
+    with open(old_path) as f:
+        old = json.load(f)["results"]
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    regressed = False
+    print("%-24s %12s %12s %9s" % ("benchmark", "old p50 us", "new p50 us",
+                                   "change"))
+    for name in old:
+        if name not in new:
+            continue
+        before, after = old[name]["p50_us"], new[name]["p50_us"]
+        change = (after - before) / before * 100
+        flag = ""
+        if change > threshold:
+            flag = "  SLOWER"
+            regressed = True
+        print("%-24s %12.2f %12.2f %+8.1f%%%s" %
+              (name, before, after, change, flag))
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = "Benchmark the calendar and collect hot paths.")
+    parser.add_argument("names", nargs = "*", metavar = "BENCHMARK",
+                        help = "benchmarks to run (default: all of %s)" %
+                        ", ".join(benchmarks))
+    parser.add_argument("-r", "--repeat", type = int, default = 20,
+                        help = "batches per benchmark")
+    parser.add_argument("--save", metavar = "FILE",
+                        help = "save the results as JSON")
+    parser.add_argument("--index", action = "store_true",
+                        help = "use the prebuilt calendar index if present")
+    parser.add_argument("--compare", nargs = 2, metavar = ("OLD", "NEW"),
+                        help = "compare two saved runs instead")
+    parser.add_argument("--threshold", type = float, default = 10,
+                        help = "percent slowdown counted as a regression")
+    opts = parser.parse_args()
+    if opts.compare:
+        exit(1 if compare(*opts.compare, opts.threshold) else 0)
+    for name in opts.names:
+        if name not in benchmarks:
+            parser.error("unknown benchmark " + name)
+    if not opts.index:
+        collects.use_calendar_index(None)
+    results = {}
+    for name in opts.names or benchmarks:
+        results[name] = measure(name, opts.repeat)
+    report(results)
+    if opts.save:
+        with open(opts.save, "w") as f:
+            json.dump({"python": python_version(),
+                       "date": date.today().isoformat(),
+                       "results": results}, f, indent = 1)
+
+if __name__ == "__main__":
+    main()
@@ -6,12 +6,25 @@
 # Collects from the Australian Prayer Book
 # Copyright 1978 The Church of England in Australia assocation.
 #
+from array import array
+import atexit
+from bisect import bisect_left
+from collections import Counter, OrderedDict, namedtuple
+from collections.abc import MutableMapping
 from datetime import date, timedelta
-from dateutil.parser import parse
-from sys import argv
+import itertools
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from time import perf_counter
 
-def calc_easter(year):
-    "Returns Easter as a date object."
+_here = os.path.dirname(os.path.abspath(__file__))
+
+def _easter_month_day(year):
+    "Anonymous Gregorian algorithm; works on ints or NumPy int arrays."
     a = year % 19
     b = year // 100
     c = year % 100
@@ -20,7 +33,56 @@ def calc_easter(year):
     f = d + e - 7 * ((a + 11 * d + 22 * e) // 451) + 114
     month = f // 31
     day = f % 31 + 1    
-    return(date(year, month, day))
+    return month, day
+
+def _jan1_ordinal(year):
+    "date(year, 1, 1).toordinal() without making a date."
+    y = year - 1
+    return 365 * y + y // 4 - y // 100 + y // 400 + 1
+
+# easter.dat holds the first year it covers (16 bits, little-endian)
+# and then, for each year, the number of days from 1 January to Easter.
+# It is made by make_easter_table.py.
+_easter_table = None
+_easter_table_first = 0
+
+def _load_easter_table():
+    global _easter_table, _easter_table_first
+    _easter_table = array('B')
+    try:
+        with open(os.path.join(_here, "easter.dat"), "rb") as f:
+            (_easter_table_first,) = struct.unpack("<H", f.read(2))
+            _easter_table.frombytes(f.read())
+    except (OSError, struct.error):
+        _easter_table = array('B')
+    return _easter_table
+
+def easter_ordinal(year):
+    "Returns Easter as a proleptic Gregorian ordinal (see date.toordinal())."
+    table = _easter_table if _easter_table is not None else _load_easter_table()
+    i = year - _easter_table_first
+    if 0 <= i < len(table):
+        return _jan1_ordinal(year) + table[i]
+    month, day = _easter_month_day(year)
+    return date(year, month, day).toordinal()
+
+def calc_easter(year):
+    "Returns Easter as a date object."
+    return date.fromordinal(easter_ordinal(year))
+
+def calc_easter_array(years, ordinals = False):
+    """Returns Easter for a whole array of years in one vectorised pass,
+    as a NumPy datetime64[D] array, or as proleptic Gregorian ordinals
+    (see date.toordinal()) if ordinals is true.
+    NumPy is only imported when this is called."""
+    import numpy as np
+    years = np.asarray(years, dtype = np.int64)
+    month, day = _easter_month_day(years)
+    months = (years - 1970).astype('datetime64[Y]').astype('datetime64[M]')
+    easter = (months + (month - 1)).astype('datetime64[D]') + (day - 1)
+    if ordinals:
+        return easter.astype(np.int64) + date(1970, 1, 1).toordinal()
+    return easter
 
 
 specials = {
@@ -90,739 +152,1842 @@ easter_rel = {
     56: "Trinity",
 }
 
+# Apart from specials, the calendar is described by rules.  Each rule
+# names the days from start to end inclusive, where start and end are
+# (anchor, offset in days), and the anchors are "jan1", "epiphany"
+# (6 January), "easter", "christmas" (25 December) and "dec31".
+# A name with {} in it is numbered by week: the week starting at origin
+# (by default start) is numbered first, the next week first + 1, and so
+# on.  Later rules override earlier ones; days that no rule covers have
+# no name.
+CalendarRule = namedtuple("CalendarRule", "name start end origin first",
+                          defaults = (None, 0))
+
+def default_calendar_rules():
+    "Returns the Prayer Book's rules, using christmas_rel and easter_rel."
+    rules = [
+        # Epiphany relative, up to the week before Septuagesima
+        CalendarRule("Christmas 2", ("jan1", 0), ("epiphany", -1)),
+        CalendarRule("Epiphany {}", ("epiphany", 0), ("easter", -64),
+                     first = 1),
+        # From the week after Trinity Sunday, until Christmas relative
+        CalendarRule("Trinity {}", ("easter", 57), ("christmas", -36),
+                     ("easter", 56)),
+        CalendarRule("Christmas 1", ("christmas", 1), ("dec31", 0)),
+    ]
+    for i, name in enumerate(christmas_rel):
+        weeks_before_Christmas = i + 1
+        rules.append(CalendarRule(name,
+                                  ("christmas", -7 * weeks_before_Christmas),
+                                  ("christmas", 6 - 7 * weeks_before_Christmas)))
+    if christmas_rel:
+        # Christmas Day is 0 weeks before Christmas, which wraps round
+        # to the end of christmas_rel.
+        rules.append(CalendarRule(christmas_rel[-1], ("christmas", 0),
+                                  ("christmas", 0)))
+    for days, name in easter_rel.items():
+        if -63 <= days <= 56:
+            rules.append(CalendarRule(name, ("easter", days), ("easter", days)))
+    return rules
+
+# The rules in use; None means default_calendar_rules().
+calendar_rules = None
+
+def _rules():
+    return calendar_rules if calendar_rules is not None else default_calendar_rules()
+
+def set_calendar_rules(rules):
+    "Uses rules for the calendar from now on; None restores the default."
+    global calendar_rules
+    calendar_rules = rules
+    clear_year_cache()
+
+def _anchors(y):
+    "Returns the day of the year (from 0) of each rule anchor in year y."
+    jan1 = _jan1_ordinal(y)
+    days = _jan1_ordinal(y + 1) - jan1
+    return {"jan1": 0, "epiphany": 5, "easter": easter_ordinal(y) - jan1,
+            "christmas": days - 7, "dec31": days - 1}
+
+def _rule_span(rule, anchors):
+    "Returns (first day, last day, week origin) of rule within the year."
+    first = max(anchors[rule.start[0]] + rule.start[1], 0)
+    last = min(anchors[rule.end[0]] + rule.end[1], anchors["dec31"])
+    origin = rule.origin or rule.start
+    return first, last, anchors[origin[0]] + origin[1]
+
+def _week_of(template, name):
+    "Returns the week number n for which template.format(n) == name, or None."
+    prefix, _, suffix = template.partition("{}")
+    number = name[len(prefix):len(name) - len(suffix)]
+    if not (name.startswith(prefix) and name.endswith(suffix) and
+            len(name) > len(prefix) + len(suffix)):
+        return None
+    try:
+        week = int(number)
+    except ValueError:
+        return None
+    return week if str(week) == number else None
+
+# Church-day names are interned as small integers so that a whole
+# year can be held as a compact array indexed by day of the year.
+# Code 0 means the day has no name, and church_date() falls back to
+# the date itself.
+_day_names = [None]
+_day_codes = {None: 0}
+
+def _day_code(name):
+    code = _day_codes.get(name)
+    if code is None:
+        code = _day_codes[name] = len(_day_names)
+        _day_names.append(name)
+    return code
+
+def compile_rules(rules, y):
+    "Returns the name codes of rules for each day of year y, as an array."
+    anchors = _anchors(y)
+    table = array('H', bytes(2 * (anchors["dec31"] + 1)))
+    for rule in rules:
+        first, last, origin = _rule_span(rule, anchors)
+        if "{}" not in rule.name:
+            if first <= last:
+                table[first:last + 1] = array('H', [_day_code(rule.name)]) * (last + 1 - first)
+            continue
+        while first <= last:
+            week = rule.first + (first - origin) // 7
+            end = min(last, origin + 7 * (week - rule.first) + 6)
+            code = _day_code(rule.name.format(week))
+            table[first:end + 1] = array('H', [code]) * (end + 1 - first)
+            first = end + 1
+    return table
+
+def _build_year_table(y):
+    """Works out the church day for every day of year y.
+    Returns (ordinal of 1 January, codes without specials, codes with
+    specials)."""
+    start = _jan1_ordinal(y)
+    plain = compile_rules(_rules(), y)
+    special = array('H', plain)
+    for n, name in _special_ordinals(y).items():
+        special[n - start] = _day_code(name)
+    return (start, plain, special)
+
+# Most recently used year tables, least recently used first.
+_year_cache = OrderedDict()
+_year_cache_size = 32
+
+def set_year_cache_size(n):
+    "Sets how many years of church-day tables are kept in memory."
+    global _year_cache_size
+    _year_cache_size = max(1, n)
+    while len(_year_cache) > _year_cache_size:
+        _year_cache.popitem(last = False)
+
+def clear_year_cache():
+    """Forgets all cached year tables, e.g., after editing specials, and
+    stops using a calendar index that no longer matches."""
+    global _index, _special_id_map, _specials_index
+    _year_cache.clear()
+    _church_days.clear()
+    _special_id_map = None
+    _specials_index = None
+    if _index is not None and _index.digest != _tables_digest():
+        _index = None
+
+def year_table(y):
+    "Returns the (cached) church-day table for year y."
+    table = _year_cache.get(y)
+    if table is None:
+        table = _year_cache[y] = _build_year_table(y)
+        if len(_year_cache) > _year_cache_size:
+            _year_cache.popitem(last = False)
+    else:
+        _year_cache.move_to_end(y)
+    return table
+
+def _tables_digest(texts = False):
+    """Returns a digest of everything the calendar depends on, so that
+    an index or cache built from different tables is not used.  The
+    collect texts are included if texts is true, else just their names."""
+    import hashlib
+    tables = [_INDEX_MAGIC.decode(), specials, sorted(easter_rel.items()),
+              christmas_rel, _rules()]
+    for table in (collects, special_collects):
+        tables.append(sorted(table.items()) if texts else sorted(table))
+    if texts:
+        # Exported page references depend on how they are found.
+        tables.append(_page_ref.pattern)
+    return hashlib.sha256(json.dumps(tables).encode()).digest()
+
+# A calendar index file is a header, then three little-endian 16-bit
+# name codes for each day (the church day, the church day ignoring
+# specials, and the day whose name picks the weekly collect), then a
+# JSON list of the names for codes 1, 2, ...
+_INDEX_MAGIC = b"COLLIDX1"
+_index_header = struct.Struct("<8sIII32s") # magic, first, days, names, digest
+
+class CalendarIndex:
+    "A prebuilt calendar index file, shared read-only via mmap."
+
+    def __init__(self, path):
+        if sys.byteorder != "little":
+            raise ValueError("calendar index needs a little-endian host")
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        if len(self._map) < _index_header.size:
+            raise ValueError("%s is not a calendar index" % path)
+        (magic, self.first, days, names_len,
+         digest) = _index_header.unpack_from(self._map)
+        if magic != _INDEX_MAGIC or digest != _tables_digest():
+            raise ValueError("%s is out of date; rebuild it" % path)
+        if len(self._map) != _index_header.size + 6 * days + names_len:
+            raise ValueError("%s is truncated; rebuild it" % path)
+        self.digest = digest
+        self.last = self.first + days - 1
+        names_at = _index_header.size + 6 * days
+        self.names = [None] + json.loads(self._map[names_at:
+                                                   names_at + names_len])
+        self.codes = memoryview(self._map)[_index_header.size:
+                                           names_at].cast('H')
+
+    def lookup(self, n):
+        """Returns the names of (church day, church day ignoring specials,
+        weekly collect day) for ordinal n, with None where the day has no
+        name, or None if n is outside the index."""
+        if not self.first <= n <= self.last:
+            return None
+        i = 3 * (n - self.first)
+        names = self.names
+        codes = self.codes
+        return names[codes[i]], names[codes[i + 1]], names[codes[i + 2]]
+
+def default_index_path():
+    return os.environ.get("COLLECTS_INDEX", os.path.join(_here, "collects.idx"))
+
+def build_index(path, first_year = 1583, last_year = 9999):
+    "Writes a calendar index covering first_year to last_year to path."
+    first = date(first_year, 1, 1).toordinal()
+    codes = array('H')
+    prev = None
+    for y in range(first_year, last_year + 1):
+        start, plain, special = table = year_table(y)
+        for i in range(len(plain)):
+            weekday = (start + i - 1) % 7  # as date.weekday()
+            sun = i - weekday if weekday != 6 else i
+            if sun >= 0:
+                week = plain[sun]
+            elif prev is not None:
+                week = prev[1][sun - prev[0] + start]
+            else:
+                week = _day_code(_plain_name(date.fromordinal(start + sun)))
+            codes.extend((special[i], plain[i], week))
+        prev = table
+    if sys.byteorder != "little":
+        codes.byteswap()
+    names = json.dumps(_day_names[1:]).encode()
+    header = _index_header.pack(_INDEX_MAGIC, first, len(codes) // 3,
+                                len(names), _tables_digest())
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(header)
+        codes.tofile(f)
+        f.write(names)
+    os.replace(tmp, path)
+
+_index = None
+_index_loaded = False
+
+def use_calendar_index(path):
+    """Answers lookups from the calendar index at path from now on, or
+    stops using an index if path is None."""
+    global _index, _index_loaded
+    _index = CalendarIndex(path) if path is not None else None
+    _index_loaded = True
+
+def calendar_index():
+    """Returns the calendar index in use, loading the default one on
+    first use, or None if there is no usable index."""
+    global _index, _index_loaded
+    if not _index_loaded:
+        _index_loaded = True
+        try:
+            _index = CalendarIndex(default_index_path())
+        except (OSError, ValueError, struct.error):
+            _index = None
+    return _index
+
+def _plain_name(d):
+    start, plain, special = year_table(d.year)
+    return _day_names[plain[d.toordinal() - start]]
+
+def _year_of(n):
+    "date.fromordinal(n).year without making a date."
+    y = (n - 1) * 400 // 146097 + 1
+    if n < _jan1_ordinal(y):
+        return y - 1
+    if n >= _jan1_ordinal(y + 1):
+        return y + 1
+    return y
+
+def _church_name(n, y, incspecials):
+    """The church-day name of ordinal n, which falls in year y, or None
+    if it has none."""
+    index = calendar_index()
+    names = index and index.lookup(n)
+    if names is not None:
+        return names[0 if incspecials else 1]
+    start, plain, special = year_table(y)
+    return _day_names[(special if incspecials else plain)[n - start]]
+
+def church_date_ordinal(n, incspecials = True):
+    "As church_date(), for a date given as date.toordinal()."
+    name = _church_name(n, _year_of(n), incspecials)
+    if name is not None:
+        return name
+    return str(date.fromordinal(n))
+
 def church_date(d, incspecials = True):
-    x = str(d.month) + '/' + str(d.day)
-    if incspecials and x in specials:
-        return specials[x]
-    y = d.year
-    easter_sun=calc_easter(y)
-    days = (d - easter_sun).days
-    if days < -63:
-        # Epiphany relative
-        epiphany = date(y, 1, 6)
-        if d < epiphany:
-            return "Christmas 2"
-        return "Epiphany " + str(1 + ((d - epiphany).days // 7))
-    if days > 56:
-        # Christmas relative
-        christmas = date(y, 12, 25)
-        if christmas < d:
-            return "Christmas 1"
-        weeks_before_Christmas = (((christmas - d).days + 6) // 7)
-        if weeks_before_Christmas < 6:
-            return christmas_rel[weeks_before_Christmas - 1]
-        week = (days - 56) // 7
-        return "Trinity " + str(week)
-    #print(days)
-    if days in easter_rel:
-        return easter_rel[days]
+    name = _church_name(d.toordinal(), d.year, incspecials)
+    if name is not None:
+        return name
     return str(d)
 
+_numbered_name = re.compile(r"(.*) (0|-?[1-9]\d*)$")
 
-collects = {
-    "Advent 1":"""
-Almighty God, give us grace that we may cast away the works of
-darkness and put on the armour of light, now in the time of this
-mortal life in which your Son Jesus Christ came among us in great
-humility; that on the last day, when he comes again in his glorious
-majesty to judge the living and the dead, we may rise to the life
-immortal; through him who lives and reigns with you and the Holy
-Spirit, now and for ever. Amen .
-(AAPB p181)
-""",
-    "Advent 2":"""
-
-Blessed Lord, you have caused all holy scriptures to be written for
-our learning: grant us so to hear them, read, mark, learn, and in-
-wardly digest them, that, encouraged and supported by your holy Word,
-we may embrace and always hold fast the joyful hope of everlasting
-life, which you have given us in our Saviour Jesus Christ. Amen.
-(AAPB p182)
-""",
-    "Advent 3":"""
-Lord Jesus Christ, at your first coming you sent your messenger to
-prepare the way before you: grant that the ministers and stewards of
-your mysteries may likewise make ready your way, by turning the hearts
-of the disobedient to the ways of the righteous, that at your second
-coming to judge the world we may be found an acceptable people in your
-sight; for you live and reign with the Father and the Holy Spirit, now
-and for ever. Amen.
-(AAPB p242)
-
-""",
-    "Advent 4":"""
-
-Raise up your great power, Lord, and come among us to save us; that,
-although through our sins we are grievously hindered in running the
-race that is set before us, your plentiful grace and mercy may
-speedily help and deliver us; through the sufficiency of your Son our
-Lord, to whom with you and the Holy Spirit be honour and glory, now
-and for ever. Amen
-(AAPB p245)
-""",
-    "Christmas 1":"""
-Lord our God, you have given us as our example the life of Jesus
-in his home: grant that all Christian families may be so bound
-together in love and service that we may rejoice together, in your
-heavenly home; through Jesus Christ our Lord, who lives and
-reigns with you and the Holy Spirit, now and for ever. Amen .
-(AAPB p189)
-""",
-    "Circumcision":"""
-Almighty God, whose blessed Son was circumcised and for man’s
-sake became obedient to the Law: purify our hearts and all our
-members, so that we may die to all sinful desires and in all things
-obey your holy will; through Jesus Christ our Lord.
-
-""",
-    "Christmas 2":"""
-    (Use Circumcision)
-Almighty God, whose blessed Son was circumcised and for man’s
-sake became obedient to the Law: purify our hearts and all our
-members, so that we may die to all sinful desires and in all things
-obey your holy will; through Jesus Christ our Lord.
-""",
-    "Presentation":"""
-Almighty and everliving God, we humbly pray that, as your only
-Son was presented in the temple as a child in accordance with the
-Law, so may we be dedicated to you with pure and clean hearts,
-through him, our Saviour and Redeemer Jesus Christ our Lord.
-(AAPB p270)
-""",
-    "Epiphany":"""
-O God, who by the leading of a star manifested your beloved Son
-to the gentiles: mercifully grant that we, who know you now by
-faith, may after this life enjoy the splendour of your glorious God-
-head; through Jesus Christ our Lord
-
-""",
-    "Epiphany 1":"""
-Lord, mercifully receive the prayers of your people who call upon
-you; and grant that we may perceive and know what things we
-ought to do, and also may have grace and power faithfully to per-
-form them; through Jesus Christ our Lord.
-(AAPB p222)
-""",
-    "Epiphany 2": """
-Almighty and everlasting God, ruler of all things in heaven and
-earth, mercifully hear the supplications of your people, and grant
-us your peace all the days of our life; through Jesus Christ our Lord.
-(AAPB p223)
-""",
-    "Epiphany 3":"""
-Almighty and everlasting God, mercifully look on our infirmities;
-and in all our dangers and necessities stretch out your right hand
-to help and defend us; through Jesus Christ our Lord.
-(AAPB p260)
-""",
-    "Epiphany 4":"""
-Lord God, you know us to be set in the midst of so many great
-dangers that by reason of the frailty of our nature we cannot always
-stand upright: grant us such strength and protection as may sup-
-port us in all dangers and carry us through all temptations;
-through Jesus Christ our Lord.
-(AAPB p249)
-""",
-    "Epiphany 5":"""
-Heavenly Father, keep your household the Church continually in
-your true religion; that those who lean only on the hope of your
-heavenly grace may always be defended by your mighty power;
-through Jesus Christ our Lord.
-(AAPB p238)
-""",
-    "Epiphany 6":""" 
-Almighty Father, whose blessed Son was revealed so that he might
-destroy the works of the devil and make us the children of God and
-heirs of eternal life: grant that having this hope we may purify
-ourselves as he is pure; that, when he shall appear again with power
-and great glory, we may be made like him in his eternal and glorious
-kingdom, where with you, Father, and with the Holy Spirit, he lives
-and reigns, one God, for evermore.
-(AAPB p190)
-""",
-    "Septuagesima":"""
-Almighty God, creator of all things and giver of every good and
-perfect gift, hear with favour the prayers of your people, that we
-who are justly punished for our offences may mercifully be
-delivered by your goodness, for the glory of your name; through
-Jesus Christ our Saviour, who lives and reigns with you and the
-Holy Spirit, one God, now and for ever.
-(AAPB p257)
-""",
-    "Sexagesima":"""
-Lord God, you know that we cannot put our trust in anything that
-we do: help us to have faith in you alone, and mercifully defend
-us by your power against all adversity; through Jesus Christ our
-Lord.
-(AAPB p246)
-""",
-    "Quinqagesima":"""
-Lord, you have taught us that whatever we do without love is
-worth nothing: send your Holy Spirit and pour into our hearts that
-most excellent gift of love, the true bond of peace and of all virtues,
-without which whoever lives is counted dead before you; grant this,
-for your only Son Jesus Christ’s sake.
-(AAPB 226)
-""",
-    "Lent 1":""" Lord Jesus Christ, for our sake you fasted forty days and forty
-nights: give us grace to use such abstinence that, our flesh being
-subdued to the spirit, we may always obey your will in righteousness
-and true holiness, to your honour and glory; for you live and reign
-with the Father and the Holy Spirit, one God, for evermore.  
-(AAPB p193)
-""",
-    "Lent 2":"""
-Almighty God, we confess that we have no power of ourselves to
-help ourselves: keep us outwardly in our bodies and inwardly in
-our souls, that we may be defended from all adversities that may
-happen to the body, and from all evil thoughts that may assault
-and hurt the soul; through Jesus Christ our Lord.
-(AAPB p196)
-""",
-    "Lent 3":"""
-We beseech you, almighty God, look on the heartfelt desires of your
-servants, and stretch forth the right hand of your power to be our
-defence against all our enemies; through Jesus Christ our Lord.
-(AAPB p194)
-""",
-    "Lent 4":"""
-Almighty God, grant that we, who justly deserve to be punished
-for our sinful deeds, may in your mercy and kindness be pardoned
-and restored; through our Lord and Saviour Jesus Christ.
-(AAPB p197)
-""",
-    "Lent 5":"""
-(Passion Sunday)
-We beseech you, almighty God, to look in mercy on your people:
-that by your great goodness they may be governed and preserved
-evermore; through Jesus Christ our Lord.
-(AAPB p199)
-""",
-    "Palm Sunday":"""
-Almighty and everlasting God, in tender love towards mankind
-you sent your Son, our Saviour Jesus Christ, to take our nature
-upon him and to suffer death on the cross, that all mankind should
-follow the example of his great humility: grant that we may follow
-the example of his suffering, and also be made partakers of his
-resurrection; through him who lives and reigns with you and the
-Holy Spirit, now and for ever.
-(AAPB p200)
-""",
-    "Easter Day":"""
-Almighty God, you have conquered death through your dearly
-beloved Son Jesus Christ and. opened to us the gate of everlasting
-life: grant us by your grace to set our mind on things above, so that
-by your continual help our whole life may be transformed; through
-Jesus Christ our Lord, who is alive and reigns with you and the
-Holy Spirit in everlasting glory.
-(AAPB p209)
-""",
-    "Easter 1":"""
-Almighty Father, you have given your only Son Jesus Christ to die
-for our sins and to rise again for our justification: grant that we
-may put away the old leaven of corruption and wickedness, and
-always serve you in sincerity and truth; through the merits of Jesus
-Christ our Lord.
-(AAPB p210)
-""",
-    "Easter 2":"""
-Almighty God, you have given your only Son to be for us both a
-sacrifice for sin and also an example of godly life; give us grace that
-we may always thankfully receive the immeasurable benefit of his
-sacrifice, and also daily endeavour to follow in the blessed steps
-of his most holy life; who now lives and reigns with you and the
-Holy Spirit, one God, for evermore. Amen.
-(AAPB p212)
-""",
-    "Easter 3":"""
-Almighty God, you show to those who are in error the light of your
-truth so that they may return into the way of righteousness: grant
-to all who are admitted into the fellowship of Christ’s service that
-they may renounce those things that are contrary to their
- profession and follow all such things as are agreeable to it; through 
-our Lord Jesus Christ  
-(AAPB p214)
-""",
-    "Easter 4":"""
-Almighty God, you alone can order the unruly wills and passions
-of sinful men: grant to your people that they may love what you
-command and desire what you promise, that so, among the many
-and varied changes of the world, our hearts may surely there be
-fixed where true joys are to be found; through Jesus Christ our
-Lord.  
-(AAPB p213)
-""",
-    "Easter 5":"""
-Heavenly Father, the giver of all good things, fill our hearts with
-thankfulness, and grant that by your holy inspiration we may think
-those things that are good, and by your merciful guidance may perform
-them; through our Lord Jesus Christ.
-(AAPB p215)
-""",
-    "Ascension Day":"""
-Grant, we pray, almighty God, that as we believe your only begotten Son to have ascended into heaven, so we may also in heart and
-mind there ascend, and with him continually dwell; who lives and
-reigns with you and the Holy Spirit, one God, for ever and ever.  
-(AAPB p217)
-""",
-    "Ascension 1":"""
-O God, the king of glory, you have exalted your only Son Jesus
-Christ with great triumph to your kingdom in heaven: leave us not
-desolate, but send your Holy Spirit to strengthen us, and exalt us
-to where our Saviour Christ has gone before, who lives and reigns
-with you and the Holy Spirit, one God, for evermore. 
-(AAPB p218)
-""",
-    "Pentecost":"""
-Almighty God, who taught the hearts of your faithful people by
-sending to them the light of your Holy Spirit: grant to us by the
-same Spirit to have a right judgment in all things and always to
-rejoice in his holy comfort; through the merits of Christ Jesus our
-Saviour, who lives and reigns with you and the Holy Spirit, one
-God, now and for ever  
-(AAPB p219)
-""",
-    "Trinity":"""
-Almighty and everlasting God, you have given us your servants
-grace by the confession of a true faith to acknowledge the glory of
-the eternal Trinity, and by your divine power to worship you as
-One: we humbly pray that you would keep us steadfast in this faith
-and evermore defend us from all adversities; through Christ our
-Lord. 
-(AAPB p220)
-""",
-    "Trinity 1":"""
-Lord God, the strength of all who put their trust in you:
-mercifully accept our prayers, and because through the weakness
-of our mortal nature we can do nothing good without you, grant
-us the help of your grace, that in keeping your commandments we
-may please you both in word and deed; through Jesus Christ our
-Lord. 
-(AAPB p225)
-""",
-    "Trinity 2":"""
-God. our refuge and strength, the author of all godliness, hear the
-devout prayers of your Church: and grant that what we ask in faith
-we may surely obtain; through Jesus Christ our Lord. AAPB 227
-""",
-    "Trinity 3":"""
-Graciously hear us, Lord God; and grant that we, to whom you
-have given the desire to pray, may by your mighty aid be defended
-and strengthened in all dangers and adversities; through Jesus
-Christ our Lord.  
-(AAPB 258)
-""",
-    "Trinity 4":"""
-Almighty God, the protector of all who put their trust in you, without
- whom nothing is strong, nothing is holy: increase and multiply
-upon us your mercy, so that with you as our ruler and guide, we
-may so pass through things temporal that we finally lose not the
-things eternal; grant this, heavenly Father, for our Lord Jesus
-Christ’s sake.
-(AAPB p243)
-""",
-    "Trinity 5":"""
-Almighty God, we pray that the course of this world may be so
-peaceably ordered through your guidance that your church may
-joyfully serve you in all godly quietness; through Jesus Christ our
-Lord.  
-(AAPB p183)
-""",
-    "Trinity 6":"""
-    God our Father, you have prepared for those who love you such
-good things as pass man’s understanding: pour into our hearts such
-love towards you, that we, loving you above all things, may obtain
-your promises which exceed all that we can desire; through Jesus
-Christ our Lord.  
-(AAPB p247)
-""",
-    "Trinity 7":"""
-  Lord of all power and might, the author and giver of all good
-things, graft in our hearts the love of your Name, increase in us
-true religion, nourish us with all goodness, and so by your mercy
-keep us; through Jesus Christ our Lord. Amen . 
-(AAPB p240)
-""",
-    "Trinity 8":"""
-Almighty God, whose never-failing providence governs all things
-in heaven and earth: we humbly ask you to put away from us all
-hurtful things, and to give us whatever may be profitable for us;
-through Jesus Christ our Lord. Amen. 
-(AAPB p233)
-""",    
-    "Trinity 9":"""
-Grant us, Lord, we pray, the spirit to think and do always such
-things as are right, that we who cannot do anything that is good
-without you, may in your strength be able to live according to your
-will; through Jesus Christ our Lord.
-(AAPB p230)
-""",
-    "Trinity 10":"""
-Let your merciful ears, Lord God, be open to the prayers of your
-people; and so that they may obtain their petitions, make them
-to ask such things as will please you; through Jesus Christ our Lord.
-(AAPB p229)
-""",
-    "Trinity 11":"""
-Lord God, you declare your almighty power chiefly in showing mercy and
-pity: grant us such a measure of your grace that, running in the way
-of your commandments, we may obtain your promises, and share in your
-heavenly treasure; through Jesus Christ our Lord. Amen .
-(AAPB p 256)
-""",
-    "Trinity 12":"""
-Almighty and everlasting God, you are always more ready to hear
-than we to pray, and constantly give more than either we desire
-or deserve: pour down on us the abundance of your mercy, 
-forgiving us those things of which our conscience is afraid, and giving
-us those good things which we are not worthy to ask, except
-through the merits and mediation of Jesus Christ, your Son our
-Lord. Amen .
-(AAPB p250)
-""",
-    "Trinity 13":"""
-Merciful God, it is by your gift alone that your faithful people offer
-you true and acceptable service; grant that we may so faithfully
-serve you in this life that we fail not finally to obtain your heavenly
-promises; through the merits of Jesus Christ our Lord.
-(AAPB p262)
-    """,
-    "Trinity 14":"""
-Almighty and eternal God, grant that we may grow in faith, hope,
-and love; and that we may obtain what you promised, make us
-love what you command; through Jesus Christ our Lord.
-(AAPB p261)
-""",
-    "Trinity 15":"""
-Keep your Church, Lord God, with your continual mercy, and 
-because the frailty of man without you cannot but fall, keep us always
-under your protection, and lead us to everything that makes for
-our salvation; through Jesus Christ our Lord. Amen
-(AAPB p232)
-""",
-    "Trinity 16":"""
-Lord, let your continual pity cleanse and defend your church, and
-because it cannot continue in safety without your aid, keep it 
-evermore by your help and goodness; through Jesus Christ our Lord.
-Amen .
-(AAPB p255)
-""",
-    "Trinity 17":"""
-    Lord, we pray that your grace may always uphold and encourage
-us, and make us continually to be given to all good works; through
-Jesus Christ our Lord. Amen
-(AAPB p236)
-""",
-    "Trinity 18":"""
-    Lord, give your people grace to withstand the temptations of the
-world, the flesh, and the devil, and with pure hearts and minds
-to follow you the only God; through Jesus Christ our Lord.
-Amen. 
-(AAPB p239)
-""",
-    "Trinity 19":"""
-    Lord God, without you we are not able to please you; mercifully
-grant that your Holy Spirit may in all things direct and rule our
-hearts; through Jesus Christ our Lord. Amen
-(AAPB p235)
-""",
-    "Trinity 20":"""
-Almighty and merciful God, of your bountiful goodness keep us
-from everything that may hurt us, that we may be ready in body
-and soul cheerfully to accomplish whatever you want us to do;
-through Jesus Christ our Lord.
-(AAPB p263)
-""",
-    "Trinity 21":"""
-Merciful Lord, grant to your faithful people pardon and peace,
-that they may be cleansed from all their sins, and serve you with
-a quiet mind; through Jesus Christ our Lord. Amen .
-(AAPB p253)
-""",
-    "Trinity 22":"""
-Father in heaven, keep your household the church steadfast in faith
-and love, that through your protection it may be free from all
-adversities, and may devoutly serve you in good works to the glory
-of your name; through Jesus Christ our Lord.
-(AAPB p265)
-""",
-    "Trinity 23":"""
-God. our refuge and strength, the author of all godliness, hear the
-devout prayers of your Church: and grant that what we ask in faith
-we may surely obtain; through Jesus Christ our Lord.
-(AAPB p227)
-""",
-    "Trinity 24":"""
-    Lord, we pray, absolve your people from their offences; that
-through your bountiful goodness we may be set free from the
-chains of those sins which in our frailty we have committed: grant
-this, heavenly Father, for the sake of Jesus Christ, our Lord and
-Saviour. Amen
-(AAPB p252)
-""",
-    "Trinity 25":""" 
-Stir up, Lord, the wills of your faithful people, that they may
-produce abundantly the fruit of good works, and receive your
-abundant reward; through Jesus Christ our Lord.
-(AAPB p266)  
-""",
-}
+class ChurchDay:
+    """A day in the church calendar, as its small integer name code.
+    str() gives the name church_date() would, and a ChurchDay compares
+    and hashes equal to that string, so it can be used to look up
+    collects.  season and week split up numbered names ("Trinity", 7);
+    special is the day's position in specials, or None.  Days without a
+    name have code 0 and season None.  Codes are handed out as names are
+    first seen, so they only mean something within one process."""
+    __slots__ = ("code", "season", "week", "special", "_name", "_hash")
 
-# Collects for non-Sundays
-special_collects = {
-    "Christ the King":"""
-Stir up, Lord, the wills of your faithful people, that they may
-produce abundantly the fruit of good works, and receive your
-abundant reward; through Jesus Christ our Lord.
-(AAPB p266)  
-""",
-    # Special Days
-    "Boxing Day; St Stephen":"""
-Lord Jesus Christ, grant that, in all our sufferings in witness to your
-truth, we may learn to look steadfastly to heaven and see by faith
-the glory that is to be revealed, and filled with the Holy Spirit may
-learn to pray for our persecutors, as Stephen your first martyr
-prayed for his murderers to you, blessed Jesus, where you stand
-at the right hand of God to aid all who suffer for you, our only
-mediator and advocate. Amen .
-(AAPB p289)
-""",
-    "Christmas Day":"""
-Almighty God, you have given us your only Son to take our nature
-upon him and as at this time to be born of a pure virgin: grant
-that we, being born again and made your children by adoption and
-grace, may daily be renewed by your Holy Spirit; through our Lord
-Jesus Christ, who lives and reigns with you and the Holy Spirit,
-one God, for ever and ever. Amen .
-(AAPB p188)
-""",
-    "Annunciation":"""
-We beseech you, Lord, pour your grace into our hearts; that, as
-we have known the incarnation of your Son Jesus Christ by the
-message of an angel, so by his cross and passion we may be brought
-to the glory of his resurrection, who lives and reigns with you and
-the Holy Spirit, one God, for ever and ever.
-(AAPB p272)
-""",
-    "St Matthias":"""
-Almighty God, you chose your faithful servant Matthias to be
-numbered among the twelve apostles in the place of Judas: grant
-that your church may always be preserved from false apostles, and
-may be guided by true and faithful pastors; through Jesus Christ
-our Lord.
-(AAPB p271)
-""",
-    "Ash Wednesday":"""
-Almighty and everlasting God, you hate nothing that you have
-made, and you forgive the sins of all who are penitent: create and
-make in us new and contrite hearts, that we, lamenting our sins
-and acknowledging our wretchedness, may obtain from you, the
-God of all mercy, perfect remission and forgiveness; through Jesus
-Christ our Lord.
-(AAPB p192)
-""",
-    "Good Friday":"""
-Almighty Father, look graciously upon this your family, for which
-our Lord Jesus Christ was willing to be betrayed and given up into
-the hands of wicked men, and to suffer death upon the cross; who
-now lives and reigns with you and the Holy Spirit, one God, for
-ever and ever.
-(AAPB p204)
-""",
-    "Easter Eve":"""
-Grant, Lord, that as we have been baptized into the death of your
-dear Son our Saviour Jesus Christ, so by continually putting to
-death our sinful desires we may die to sin and be buried with him,
-and that through the grave and gate of death we may pass to our
-joyful resurrection; for his sake who died and was buried and rose
-again for us, your Son Jesus Christ our Lord.
-(APPB p208)
-""",
-    "St Mark; ANZAC day":"""
-Almighty God, we thank you for the gospel of your Son Jesus
-Christ committed to us by the hand of your evangelist Saint Mark:
-grant that we may not be carried away with every changing wind
-of teaching, but may be firmly established in the truth of your
-word; through Jesus Christ our Lord.
-(AAPB p273)
-""",
-    "St John the Evangelist":"""
-Merciful Lord, let your glory shine upon your Church; that,
-enlightened by the teaching of your blessed apostle and evangelist
-Saint John, we may walk in the light of your truth and come at
-last to the splendour of eternal life; through Jesus Christ our Lord.
-(AAPB p290)
-""",
-    "The Innocents":"""
-Almighty God, whose loving purposes cannot be frustrated by the
-wickedness of men, so that even infants may glorify you by their
-deaths: strengthen us by your grace, that by the innocency of our
-lives and the constancy of our faith even to death, we may glorify
-your holy Name; through Jesus Christ our Lord.
-(AAPB p291)
-""",
-    "St Philip and St James":"""
-Almighty God, whom truly to know is eternal life: grant us per-
-fectly to know your Son Jesus Christ to be the way, the truth, and
-the life, that, following in the steps of your holy apostles Saint
-Philip and Saint James, we may steadfastly walk in the way that
-leads to eternal life; through Jesus Christ your Son our Lord.
-    (AAPB p274)
-    """,
-    "St Barnabas":"""
-Lord God Almighty, who endowed your apostle Barnabas with
-faith and the Holy Spirit for the work to which he was called: do
-not leave us destitute of your abundant gifts, or of grace to use them
-always for your honour and glory; through Jesus Christ our Lord.
-(AAPB p275)
-""",
-    "John the Baptist":"""
-Almighty God, by whose providence your servant John the Baptist was
-wonderfully born, and sent to prepare the way for your Son our Saviour
-by preaching repentance: grant that we may truly repent according to
-his teaching, and following his example may constantly speak the
-truth, boldly rebuke vice, and patiently suffer for the truth’s sake;
-through Jesus Christ our Lord.
-(AAPB p276)
-""",
-    "St Peter": """
-Almighty God, who by your Son Jesus Christ gave your apostle
-Peter many excellent gifts, and commanded him earnestly to feed
-your flock: enable, we pray, all bishops and pastors diligently to
-preach your holy word, and your people obediently to follow it,
-that they may receive the crown of everlasting glory; through Jesus
-Christ our Lord.
-(AAPB p277)
-""",
-    "Mary Magdelen":"""
-Merciful God, whose Son Jesus Christ called Mary Magdalen to
-be a witness to his resurrection: mercifully grant that by your grace
-we may serve you in the power of his risen life; through Jesus Christ
-our Lord.
-(AAPB p278)
-""",
-    "St James the Apostle":"""
-Merciful God, whose apostle James left his father, and all that he
-had, and without delay obeyed the call of your Son Jesus Christ
-and followed him: grant that no worldly affections may draw us
-away from steadfast devotion to your service, but that we may be
-always ready to do what you command; through Jesus Christ our
-Lord.
-(AAPB p279)
-""",
-    "Transfiguration":"""
-Eternal God, our glorious King, whose Son Jesus Christ was seen
-in splendour by his chosen witnesses: give us, your servants, faith
-to see in him the true light and to walk in his way, that we may
-be transformed into his likeness and live with him in glory; where
-he lives and reigns with you and the Holy Spirit, one God, for ever
-and ever.
-(AAPB p280)
-""",
-    "St Bartholomew":"""
-Almighty and eternal God, who gave your apostle Bartholomew
-grace truly to believe and to preach your word: grant that your
-Church may love that word, and both preach and receive it;
-through Jesus Christ our Lord.
-(AAPB p281)
-""",
-    "St Matthew":"""
-Almighty God, whose beloved Son called Matthew from his place
-of business to be an apostle and evangelist: set us free from all greed
-and selfish love of money, to follow our Master Jesus Christ; who
-lives and reigns with you and the Holy Spirit, now and for ever.
-(AAPB p282)
-""",
-    "St Michael and all Angels":"""
-Eternal God, by whom the ministries of angels and men have been
-ordained and constituted in a wonderful order: grant that as your
-holy angels always serve you in heaven, so by your appointment
-they may help and defend us on earth; through our Lord and
-Saviour Jesus Christ, who lives and reigns with you and the Holy
-Spirit, one God, for evermore.
-(AAPB p283)
-""",
-    "St Luke":"""
-Almighty God, who called Luke the physician to be an evangelist
-and physician of the soul: grant that through his teaching we may
-know the certainty of the things which belong to your kingdom,
-and that all the diseases of our souls may be healed; through the
-merits of your Son Jesus Christ our Lord.
-(AAPB p284)
-""",
-    "St Simon and St Jude":"""
-Almighty God, you have built your Church on the foundation of
-the apostles and prophets, with Jesus Christ himself as the chief
-corner-stone: grant us to be so joined together in unity of spirit by
-their doctrine, that we may grow into a holy temple, acceptable
-to you; through Jesus Christ our Lord.
-(AAPB p285)
-""",
-    "All Saints":"""
-We praise you, heavenly Father, that you have knit together your
-elect in one communion and fellowship in the mystical body of
-your Son Christ our Lord; give us grace so to follow your blessed
-saints in all virtuous and godly living, that we may come to those
-inexpressible joys that you have prepared for those who love you;
-through Jesus Christ our Lord.
-(AAPB p286)
-""",
-    "St Andrew":"""
-Almighty God, who gave such grace to your apostle Andrew that
-he readily obeyed the call of your Son Jesus Christ and followed
-him without delay: grant that we who are called by your holy word
-may give ourselves at once to do what you command; through
-Jesus Christ our Lord.
-(AAPB p287)
-""",
-    "St Thomas":"""
-Eternal God, who strengthened Thomas your apostle, when he was
-in doubt, with sure and certain faith in the resurrection of your
-Son our Lord Jesus Christ: grant that we may be not faithless but
-believing, until we come to see our Saviour in his glory face to face;
-who lives and reigns with you and the Holy Spirit, one God, now
-and for ever.
-(AAPB p288)
-""",
-   
-}
+    def __init__(self, code, name):
+        self.code = code
+        self._name = name
+        self._hash = hash(name)
+        numbered = _numbered_name.match(name) if code else None
+        if numbered:
+            self.season, self.week = numbered[1], int(numbered[2])
+        else:
+            self.season, self.week = (name if code else None), None
+        self.special = _special_ids().get(name) if code else None
 
-def collect_for(dd):
-    ret = []
-    if dd.weekday() != 6:
-        sun = dd - timedelta(days = dd.weekday())
+    @classmethod
+    def from_code(cls, code):
+        "Returns the shared ChurchDay for a name code from the year tables."
+        day = _church_days.get(code)
+        if day is None:
+            day = _church_days[code] = cls(code, _day_names[code])
+        return day
+
+    def __str__(self):
+        return self._name
+
+    def __repr__(self):
+        return "ChurchDay(%r)" % self._name
+
+    def __int__(self):
+        return self.code
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, ChurchDay):
+            return self._name == other._name
+        if isinstance(other, str):
+            return self._name == other
+        return NotImplemented
+
+_church_days = {}
+_special_id_map = None
+
+def _special_ids():
+    global _special_id_map
+    if _special_id_map is None:
+        _special_id_map = {name: i for i, name in enumerate(specials.values())}
+    return _special_id_map
+
+def church_day(d, incspecials = True):
+    """Like church_date(), but returns a ChurchDay straight from the
+    year table's code.  Every named day is one shared object, so bulk
+    callers don't allocate new strings."""
+    n = d.toordinal()
+    index = calendar_index()
+    names = index and index.lookup(n)
+    if names is not None:
+        name = names[0 if incspecials else 1]
+        code = _day_code(name) if name is not None else 0
     else:
-        sun = dd
-    day = church_date(dd)
+        start, plain, special = year_table(d.year)
+        code = (special if incspecials else plain)[n - start]
+    if code:
+        return ChurchDay.from_code(code)
+    return ChurchDay(0, str(d))
+
+
+def _subtract_span(ranges, first, last):
+    "Returns ranges, a list of (first, last), without the days first to last."
+    ret = []
+    for a, b in ranges:
+        if a < first:
+            ret.append((a, min(b, first - 1)))
+        if b > last:
+            ret.append((max(a, last + 1), b))
+    return ret
+
+def _name_ranges(name, y):
+    """Returns the (first, last) ordinals of the runs of days in year y
+    that church_date(d, incspecials = False) calls name.  This solves the
+    calendar rules for the name rather than scanning the year."""
+    anchors = _anchors(y)
+    ranges = []
+    for rule in _rules():
+        first, last, origin = _rule_span(rule, anchors)
+        if first > last:
+            continue
+        ranges = _subtract_span(ranges, first, last)
+        if "{}" in rule.name:
+            week = _week_of(rule.name, name)
+            if week is None:
+                continue
+            start = origin + 7 * (week - rule.first)
+            first, last = max(first, start), min(last, start + 6)
+        elif rule.name != name:
+            continue
+        if first <= last:
+            ranges.append((first, last))
+    jan1 = _jan1_ordinal(y)
+    return [(jan1 + a, jan1 + b) for a, b in ranges]
+
+def _special_ordinals(y):
+    "Returns {ordinal: name} for the special days in year y."
+    ret = {}
+    for md, name in specials.items():
+        month, day = md.split('/')
+        try:
+            ret[date(y, int(month), int(day)).toordinal()] = name
+        except ValueError:
+            # e.g., 2/29 in a non-leap year
+            continue
+    return ret
+
+def dates_for(name, first_year, last_year, incspecials = True):
+    """Yields, in order, every date from first_year to last_year that
+    church_date(d, incspecials) calls name.  Each year is solved
+    directly rather than by looking at each of its days."""
+    for y in range(first_year, last_year + 1):
+        days = set()
+        for first, last in _name_ranges(name, y):
+            days.update(range(first, last + 1))
+        if incspecials:
+            found = _special_ordinals(y)
+            days = {n for n in days if n not in found}
+            days.update(n for n, special in found.items() if special == name)
+        for n in sorted(days):
+            yield date.fromordinal(n)
+
+SpecialDay = namedtuple("SpecialDay", "date name")
+
+# The special days sorted by their day of a leap year, so the next or
+# previous one can be found by bisection: ([day of year], [(month,
+# day, name)]).  Built when first needed; clear_year_cache() drops it.
+_specials_index = None
+
+def _leap_day_of_year(month, day):
+    "Day of the year (from 0) that month/day is in a leap year."
+    return date(2000, month, day).toordinal() - 730120
+
+def _specials():
+    global _specials_index
+    if _specials_index is None:
+        entries = []
+        for md, name in specials.items():
+            month, day = map(int, md.split('/'))
+            entries.append((_leap_day_of_year(month, day), month, day, name))
+        entries.sort()
+        _specials_index = ([e[0] for e in entries],
+                           [e[1:] for e in entries])
+    return _specials_index
+
+def _specials_in_year(y, lo, hi):
+    """Yields a SpecialDay for each special day of year y whose leap-year
+    day of the year is in range(lo, hi)."""
+    keys, entries = _specials()
+    for month, day, name in entries[bisect_left(keys, lo):bisect_left(keys, hi)]:
+        try:
+            yield SpecialDay(date(y, month, day), name)
+        except ValueError:
+            # e.g., 2/29 in a non-leap year
+            continue
+
+def specials_between(start, end):
+    """Yields, in order, a SpecialDay(date, name) for each special day
+    from start up to and including end."""
+    for y in range(start.year, end.year + 1):
+        lo = _leap_day_of_year(start.month, start.day) if y == start.year else 0
+        hi = _leap_day_of_year(end.month, end.day) + 1 if y == end.year else 366
+        yield from _specials_in_year(y, lo, hi)
+
+def next_special(d):
+    "Returns the SpecialDay for the first special day after d, or None."
+    lo = _leap_day_of_year(d.month, d.day) + 1
+    # A year may have none left, or only 29 February, so look a few on.
+    for y in range(d.year, min(d.year + 8, 9999) + 1):
+        for found in _specials_in_year(y, lo, 366):
+            return found
+        lo = 0
+    return None
+
+def prev_special(d):
+    "Returns the SpecialDay for the last special day before d, or None."
+    keys, entries = _specials()
+    hi = _leap_day_of_year(d.month, d.day)
+    for y in range(d.year, max(d.year - 8, 1) - 1, -1):
+        i = bisect_left(keys, hi)
+        while i:
+            i -= 1
+            month, day, name = entries[i]
+            try:
+                return SpecialDay(date(y, month, day), name)
+            except ValueError:
+                continue
+        hi = 366
+    return None
+
+# The collect texts live in collects.txt beside this file.  Only the
+# positions of the entries are found when it is first used; each text
+# is decoded from the memory-mapped file when it is first looked up.
+_collect_header = re.compile(rb"^%% (\w+): (.*)\n", re.M)
+
+class _CollectFile:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        self.sections = {}
+        entries = list(_collect_header.finditer(self._map))
+        ends = [m.start() - 1 for m in entries[1:]] + [len(self._map) - 1]
+        for m, end in zip(entries, ends):
+            section = self.sections.setdefault(m[1].decode(), {})
+            section[m[2].decode("utf-8")] = (m.end(), end)
+
+    def text(self, start, end):
+        return self._map[start:end].decode("utf-8")
+
+_collect_file = None
+
+def _collects_data():
+    global _collect_file
+    if _collect_file is None:
+        _collect_file = _CollectFile(os.path.join(_here, "collects.txt"))
+    return _collect_file
+
+class CollectStore(MutableMapping):
+    """A dict of collect texts for one table in collects.txt, read from
+    the file as they are needed."""
+
+    def __init__(self, section):
+        self.section = section
+        self._index = None
+        self._texts = {}
+
+    def _keys(self):
+        if self._index is None:
+            self._index = dict(_collects_data().sections.get(self.section, {}))
+        return self._index
+
+    def __getitem__(self, key):
+        # A text set to None is stored as None, so test for the key.
+        if key in self._texts:
+            return self._texts[key]
+        text = self._texts[key] = _collects_data().text(*self._keys()[key])
+        return text
+
+    def __setitem__(self, key, text):
+        self._keys()[key] = None
+        self._texts[key] = text
+
+    def __delitem__(self, key):
+        del self._keys()[key]
+        self._texts.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._keys()
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.section)
+
+collects = CollectStore("collects")
+special_collects = CollectStore("special_collects")
+
+def _collect_list(day, nonspecial):
+    ret = []
     if day in special_collects:
         ret.append((day, special_collects[day], True))
-    nonspecial = church_date(sun, incspecials = False)
     if nonspecial in collects:
         ret.append((nonspecial, collects[nonspecial], False))
     return ret
 
-def print_collect(day):
-    x = collect_for(day)
-    for (dd, collect, special) in x:
-        print(dd)
+def _collect_for(n, y):
+    "collect_for() of ordinal n, which falls in year y."
+    weekday = (n - 1) % 7
+    sun = n - weekday if weekday != 6 else n
+    index = calendar_index()
+    names = index and index.lookup(n)
+    if names is not None:
+        # One lookup gives both; with stats on it is counted as index.
+        day, _, week = names
+    else:
+        day = _church_name(n, y, True)
+        week = _church_name(sun, y if sun >= _jan1_ordinal(y) else y - 1, False)
+    return _collect_list(day or str(date.fromordinal(n)),
+                         week or str(date.fromordinal(sun)))
+
+def collect_for_ordinal(n):
+    "As collect_for(), for a date given as date.toordinal()."
+    return _collect_for(n, _year_of(n))
+
+def collect_for(dd):
+    return _collect_for(dd.toordinal(), dd.year)
+
+CalendarEntry = namedtuple("CalendarEntry", "date church_day collects")
+
+def iter_calendar(start, end, step = 1):
+    """Yields a CalendarEntry(date, church_day, collects) for every
+    step'th day from start up to and including end; step is a number
+    of days or a timedelta.  church_day is a ChurchDay, and collects is
+    as returned by collect_for().
+    Entries are produced lazily, looking each year's table up once."""
+    if isinstance(step, timedelta):
+        step = step.days
+    if step < 1:
+        raise ValueError("step must be at least one day")
+    year = None
+    for n in range(start.toordinal(), end.toordinal() + 1, step):
+        d = date.fromordinal(n)
+        if d.year != year:
+            year = d.year
+            first, plain, special = year_table(year)
+        code = special[n - first]
+        day = ChurchDay.from_code(code) if code else ChurchDay(0, str(d))
+        weekday = d.weekday()
+        sun = n - weekday if weekday != 6 else n
+        if sun >= first:
+            code = plain[sun - first]
+            nonspecial = _day_names[code] if code else str(date.fromordinal(sun))
+        else:
+            nonspecial = church_date(date.fromordinal(sun), incspecials = False)
+        yield CalendarEntry(d, day, _collect_list(str(day), nonspecial))
+
+def collects_for_week(any_day):
+    """Returns a CalendarEntry for each day from the Sunday on or before
+    any_day to the Saturday after it.  The Sunday and weekday collect
+    names are worked out once for the whole week."""
+    sunday = any_day - timedelta(days = (any_day.weekday() + 1) % 7)
+    sunday_name = church_date(sunday, incspecials = False)
+    weekday_name = church_date(sunday + timedelta(days = 1), incspecials = False)
+    week = []
+    for i in range(7):
+        d = sunday + timedelta(days = i)
+        day = church_day(d)
+        week.append(CalendarEntry(d, day, _collect_list(
+            str(day), weekday_name if i else sunday_name)))
+    return week
+
+def upcoming_weeks(count, start = None):
+    """Yields collects_for_week() for count weeks, starting with the
+    week containing start (by default today)."""
+    sunday = start or date.today()
+    for _ in range(count):
+        week = collects_for_week(sunday)
+        yield week
+        sunday = week[0].date + timedelta(days = 7)
+
+def format_collect(day):
+    "Returns what print_collect() prints for day, as one string."
+    ret = []
+    for (dd, collect, special) in collect_for(day):
+        ret.append(dd + "\n")
         if collect is None:
-            print("Please add collect for " + dd + " to code")
+            ret.append("Please add collect for " + dd + " to code\n")
             continue
         if special:
-            print("Special day")
-        print(collect)
-
-if len(argv) == 1:
-    # Print next Sunday's collect.
-   today = date.today()
-   day = today + timedelta(days = 6 - today.weekday())
-   print_collect(day)
-else:
-    for d in argv[1:]:
+            ret.append("Special day\n")
+        ret.append(collect + "\n")
+    return "".join(ret)
+
+def print_collect(day, out = None):
+    (out or sys.stdout).write(format_collect(day))
+
+def collect_record(day):
+    "Returns the church day and collects for day as a JSON-ready dict."
+    return {
+        "date": day.isoformat(),
+        "church_day": church_date(day),
+        "collects": [{"name": dd, "collect": collect, "special": special}
+                     for (dd, collect, special) in collect_for(day)],
+    }
+
+# Common date formats that can be converted without dateutil,
+# with the group numbers of the year, month and day.
+_fast_date_formats = [
+    (re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})$"), (1, 2, 3)), # YYYY-MM-DD
+    (re.compile(r"(\d{4})(\d\d)(\d\d)$"), (1, 2, 3)),       # YYYYMMDD
+    (re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})$"), (3, 2, 1)), # D/M/YYYY
+]
+
+def parse_date(s):
+    """Converts a string to a date, raising ValueError if it can't.
+    dateutil is only imported for strings not in one of the common
+    formats above.  Dates with slashes are read day first either way."""
+    s = s.strip()
+    for pattern, (y, m, d) in _fast_date_formats:
+        match = pattern.match(s)
+        if match:
+            # Not handed on to dateutil, which would read 3/14/2021 as
+            # 14 March.
+            return date(int(match[y]), int(match[m]), int(match[d]))
+    from dateutil.parser import parse
+    dx = parse(s, dayfirst = True)
+    return date(dx.year, dx.month, dx.day)
+
+def parse_dates(strings):
+    "Converts a list of strings to dates, with None for any that can't be."
+    ret = []
+    for s in strings:
+        try:
+            ret.append(parse_date(s))
+        except (ValueError, OverflowError):
+            ret.append(None)
+    return ret
+
+def next_sunday():
+    today = date.today()
+    return today + timedelta(days = 6 - today.weekday())
+
+def write_collects(strings, out, as_json = False, flush = False):
+    """Writes the collects for each date string in strings to out, as
+    text or as newline-delimited JSON.  If flush is true, out is
+    flushed after each date."""
+    for s in strings:
+        try:
+            day = parse_date(s)
+        except (ValueError, OverflowError):
+            error = "Can't coerce %s to a date" % s
+            if as_json:
+                out.write(json.dumps({"input": s, "error": error}) + "\n")
+            else:
+                out.write(error + "\n\n")
+        else:
+            if as_json:
+                out.write(json.dumps(collect_record(day)) + "\n")
+            else:
+                out.write(format_collect(day))
+        if flush:
+            out.flush()
+
+def _buffered_stdout():
+    "Returns a writer on standard output with a large buffer."
+    try:
+        fd = sys.stdout.fileno()
+    except (AttributeError, OSError):
+        return _TimedWriter(sys.stdout) if stats_enabled() else sys.stdout
+    sys.stdout.flush()
+    out = open(fd, "w", buffering = 1 << 16, encoding = sys.stdout.encoding,
+               closefd = False)
+    return _TimedWriter(out) if stats_enabled() else out
+
+AuditReport = namedtuple("AuditReport",
+    "days missing unreachable fallback_days fallback_offsets no_weekly_days")
+
+def audit_calendar(first_year = 1583, last_year = 9999):
+    """Sweeps every day from first_year to last_year through the year
+    tables, and returns an AuditReport of:
+        missing           {name: first date} for church days that
+                          have no collect in either table
+        unreachable       collect names no day ever looks up
+        fallback_days     how many days church_date() calls by their date
+        fallback_offsets  {days after Easter: count} for those days
+        no_weekly_days    how many days have no weekly collect name
+    """
+    day_counts = Counter()  # codes looked up in special_collects
+    week_counts = Counter() # codes looked up in collects
+    first_seen = {}
+    fallback_offsets = Counter()
+    no_weekly = 0
+    prev_plain = None
+    for y in range(first_year, last_year + 1):
+        start, plain, special = _build_year_table(y)
+        length = len(plain)
+        counts = Counter(special)
+        day_counts.update(counts)
+        for table in (special, plain):
+            for code in set(table).difference(first_seen):
+                first_seen[code] = start + table.index(code)
+        # Monday to Saturday use Monday's name; Sunday uses its own.
+        monday = (7 - (start - 1) % 7) % 7
+        sunday = (monday + 6) % 7
+        for i in range(monday, length, 7):
+            week_counts[plain[i]] += min(6, length - i)
+        for i in range(sunday, length, 7):
+            week_counts[plain[i]] += 1
+        if monday:
+            # The days before the first Monday use last December's Monday.
+            if prev_plain is not None:
+                code = prev_plain[monday - 7]
+            else:
+                code = _day_code(_plain_name(date.fromordinal(start + monday - 7)))
+            week_counts[code] += monday - (1 if sunday < monday else 0)
+        no_weekly += week_counts.pop(0, 0)
+        if counts[0]:
+            easter_sun = easter_ordinal(y) - start
+            for i, code in enumerate(special):
+                if not code:
+                    fallback_offsets[i - easter_sun] += 1
+        prev_plain = plain
+    missing = {}
+    for code in sorted(set(day_counts) | set(week_counts),
+                       key = lambda code: first_seen.get(code, 0)):
+        name = _day_names[code]
+        if code and name not in collects and name not in special_collects:
+            missing[name] = date.fromordinal(first_seen[code])
+    used_days = {_day_names[code] for code in day_counts if code}
+    used_weeks = {_day_names[code] for code in week_counts}
+    unreachable = ([name for name in special_collects if name not in used_days] +
+                   [name for name in collects if name not in used_weeks])
+    total = date(last_year, 12, 31).toordinal() - date(first_year, 1, 1).toordinal() + 1
+    return AuditReport(total, missing, unreachable, sum(fallback_offsets.values()),
+                       dict(sorted(fallback_offsets.items())), no_weekly)
+
+# Page references are mostly "(AAPB p123)", but some texts have
+# "(AAPB 123)", "(AAPB p 123)", "AAPB 123" or "(APPB p123)".
+_page_ref = re.compile(r"\(?A[AP]PB (?:p ?)?(\d+)\)?")
+
+def _page_refs(text):
+    "Returns the page references in text, each as 'AAPB pNNN'."
+    return ["AAPB p" + page for page in _page_ref.findall(text)]
+
+# Words for searching: hyphenated line breaks are joined up and curly
+# apostrophes straightened first.
+_hyphen_break = re.compile(r"-\n\s*")
+_word = re.compile(r"[a-z]+(?:'[a-z]+)*")
+
+def _words(text):
+    text = _hyphen_break.sub("", text).replace("\u2019", "'").lower()
+    return _word.findall(text)
+
+SearchHit = namedtuple("SearchHit", "name page special")
+
+_search_docs = None
+_search_index = None
+
+def _build_search_index():
+    """Indexes every word of every collect: word -> {document number:
+    [word positions]}.  Documents are SearchHits."""
+    global _search_docs, _search_index
+    _search_docs = []
+    _search_index = {}
+    for table, special in ((collects, False), (special_collects, True)):
+        for name, text in table.items():
+            if text is None:
+                continue
+            pages = _page_refs(text)
+            doc = len(_search_docs)
+            _search_docs.append(SearchHit(name, pages[0] if pages else None,
+                                          special))
+            for pos, word in enumerate(_words(text)):
+                _search_index.setdefault(word, {}).setdefault(doc, []).append(pos)
+
+def search_collects(query, phrase = True):
+    """Returns a SearchHit(name, page, special) for each collect that has
+    the words of query in it, next to each other and in order if phrase
+    is true.  The word index is built on first use."""
+    if _search_index is None:
+        _build_search_index()
+    words = _words(query)
+    if not words:
+        return []
+    postings = [_search_index.get(word, {}) for word in words]
+    docs = set(postings[0]).intersection(*postings[1:])
+    if phrase:
+        docs = [doc for doc in docs
+                if any(all(pos + i in postings[i][doc]
+                           for i in range(1, len(words)))
+                       for pos in postings[0][doc])]
+    return [_search_docs[doc] for doc in sorted(docs)]
+
+export_fields = ("date", "church_day", "sunday", "collects", "pages")
+
+def export_year(y):
+    """Returns a row of export_fields for every day of year y: the date,
+    its church day, the day that picks the weekly collect, and lists of
+    the names and page references of its collects."""
+    rows = []
+    for d, day, found in iter_calendar(date(y, 1, 1), date(y, 12, 31)):
+        sun = d - timedelta(days = d.weekday()) if d.weekday() != 6 else d
+        rows.append((d.isoformat(), str(day), church_date(sun, incspecials = False),
+                     [name for name, _, _ in found],
+                     [ref for _, text, _ in found if text is not None
+                      for ref in _page_refs(text)]))
+    return rows
+
+def _export_years(years, jobs = None):
+    """Yields the export_year() rows for each of years in turn, working
+    them out in parallel in a pool of jobs processes (one per CPU by
+    default)."""
+    if jobs == 1:
+        for y in years:
+            yield export_year(y)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(jobs) as pool:
+        if not stats_enabled():
+            yield from pool.map(export_year, years, chunksize = 8)
+            return
+        for rows, calls, seconds, hits in pool.map(_export_year_stats, years,
+                                                   chunksize = 8):
+            stats.merge(calls, seconds, hits)
+            yield rows
+
+def _export_year_stats(y):
+    """export_year() in a worker process, also returning what it
+    recorded in stats, for the parent to merge."""
+    enable_stats()
+    stats.reset()
+    rows = export_year(y)
+    return rows, stats.calls, stats.seconds, stats.hits
+
+def export_rows(first_year, last_year, jobs = None):
+    "Yields the export_year() rows for first_year to last_year in date order."
+    for rows in _export_years(range(first_year, last_year + 1), jobs):
+        yield from rows
+
+def write_export(rows, out, fmt = "csv"):
+    """Writes export rows to out as CSV (with a header, and lists joined
+    by "; ") or as a JSON list."""
+    if fmt == "csv":
+        import csv
+        writer = csv.writer(out)
+        writer.writerow(export_fields)
+        writer.writerows((d, day, sun, "; ".join(names), "; ".join(pages))
+                         for d, day, sun, names, pages in rows)
+        return
+    out.write("[")
+    sep = "\n"
+    for row in rows:
+        out.write(sep + json.dumps(dict(zip(export_fields, row))))
+        sep = ",\n"
+    out.write("\n]\n")
+
+_cache_schema = """
+CREATE TABLE IF NOT EXISTS calendar (
+    digest TEXT NOT NULL,
+    ordinal INTEGER NOT NULL,
+    church_day TEXT NOT NULL,
+    sunday TEXT NOT NULL,
+    collects TEXT NOT NULL,
+    pages TEXT NOT NULL,
+    PRIMARY KEY (digest, ordinal)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS years (
+    digest TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    PRIMARY KEY (digest, year)
+) WITHOUT ROWID;
+"""
+
+class CalendarCache:
+    """An SQLite file of export_year() rows, shared between runs.  Rows
+    are keyed by a digest of the calendar rules, specials and collect
+    texts, so editing any of those makes the old rows unused; they are
+    deleted the next time the cache is filled."""
+
+    # Years written to the file per transaction; other processes can
+    # use the file between them.
+    batch_years = 16
+
+    def __init__(self, path, timeout = 60):
+        import sqlite3
+        self.db = sqlite3.connect(path, timeout = timeout)
+        # Readers don't block the writer, or the writer readers.
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(_cache_schema)
+        self.digest = _tables_digest(texts = True).hex()
+
+    def fill(self, years, jobs = None):
+        """Works out and stores whichever of years aren't cached yet.
+        The years are worked out before each short write, so several
+        processes can fill the same file."""
+        if not years:
+            return
+        have = {y for (y,) in self.db.execute(
+            "SELECT year FROM years WHERE digest = ? AND year BETWEEN ? AND ?",
+            (self.digest, min(years), max(years)))}
+        missing = [y for y in years if y not in have]
+        if not missing:
+            return
+        with self.db:
+            self.db.execute("DELETE FROM calendar WHERE digest != ?",
+                            (self.digest,))
+            self.db.execute("DELETE FROM years WHERE digest != ?",
+                            (self.digest,))
+        computed = zip(missing, _export_years(missing, jobs))
+        while True:
+            batch = list(itertools.islice(computed, self.batch_years))
+            if not batch:
+                break
+            with self.db:
+                for y, rows in batch:
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO calendar VALUES (?, ?, ?, ?, ?, ?)",
+                        ((self.digest, date.fromisoformat(d).toordinal(), day,
+                          sunday, json.dumps(names), json.dumps(pages))
+                         for d, day, sunday, names, pages in rows))
+                    # Another process may have stored the year meanwhile.
+                    self.db.execute("INSERT OR IGNORE INTO years VALUES (?, ?)",
+                                    (self.digest, y))
+
+    def rows(self, start, end, jobs = None):
+        """Yields export_year() rows for the dates start to end, filling
+        in any years not yet in the cache first."""
+        self.fill(range(start.year, end.year + 1), jobs)
+        cursor = self.db.execute(
+            "SELECT ordinal, church_day, sunday, collects, pages FROM calendar"
+            " WHERE digest = ? AND ordinal BETWEEN ? AND ? ORDER BY ordinal",
+            (self.digest, start.toordinal(), end.toordinal()))
+        for n, day, sunday, names, pages in cursor:
+            yield (date.fromordinal(n).isoformat(), day, sunday,
+                   json.loads(names), json.loads(pages))
+
+    def close(self):
+        self.db.close()
+
+def _ics_text(text):
+    "Escapes text for an iCalendar property value."
+    return (text.replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\n", "\\n"))
+
+def _ics_line(line):
+    "Folds a content line into pieces of at most 75 octets, ending in CRLF."
+    data = line.encode("utf-8")
+    pieces = []
+    while len(data) > (74 if pieces else 75):
+        cut = 74 if pieces else 75
+        while (data[cut] & 0xC0) == 0x80:
+            cut -= 1 # don't split a UTF-8 sequence
+        pieces.append(data[:cut])
+        data = data[cut:]
+    pieces.append(data)
+    return b"\r\n ".join(pieces).decode("utf-8") + "\r\n"
+
+_ics_header = "".join(map(_ics_line, ("BEGIN:VCALENDAR", "VERSION:2.0",
+    "PRODID:-//collects.py//Book of Common Prayer calendar//EN",
+    "CALSCALE:GREGORIAN", "X-WR-CALNAME:Church Calendar")))
+_ics_footer = _ics_line("END:VCALENDAR")
+
+def ics_events(start, end):
+    """Yields a VEVENT for every Sunday and special day from start to
+    end, with the church day as its summary and the collects as its
+    description."""
+    for d, day, found in iter_calendar(start, end):
+        if d.weekday() != 6 and day.special is None:
+            continue
+        description = "\n".join(name + "\n" + text.strip()
+                                for name, text, _ in found if text is not None)
+        stamp = d.strftime("%Y%m%d")
+        yield "".join(map(_ics_line, (
+            "BEGIN:VEVENT",
+            "UID:%s@collects" % stamp,
+            "DTSTAMP:%sT000000Z" % stamp,
+            "DTSTART;VALUE=DATE:" + stamp,
+            "DTEND;VALUE=DATE:" + (d + timedelta(days = 1)).strftime("%Y%m%d"),
+            "SUMMARY:" + _ics_text(str(day)),
+            "DESCRIPTION:" + _ics_text(description),
+            "TRANSP:TRANSPARENT",
+            "END:VEVENT")))
+
+def write_ics(out, start, end):
+    "Writes an iCalendar feed from start to end to out, one event at a time."
+    out.write(_ics_header)
+    for event in ics_events(start, end):
+        out.write(event)
+    out.write(_ics_footer)
+
+def write_ics_years(directory, first_year, last_year, regenerate = False):
+    """Writes a feed for each year to directory/YEAR.ics, recording a
+    hash of each in directory/hashes.json.  If regenerate is true, years
+    whose content hasn't changed are left untouched.  Returns the years
+    written."""
+    import hashlib
+    os.makedirs(directory, exist_ok = True)
+    manifest = os.path.join(directory, "hashes.json")
+    try:
+        with open(manifest) as f:
+            hashes = json.load(f)
+    except (OSError, ValueError):
+        hashes = {}
+    written = []
+    for y in range(first_year, last_year + 1):
+        path = os.path.join(directory, "%d.ics" % y)
+        digest = hashlib.sha256()
+        with open(path + ".tmp", "w", encoding = "utf-8", newline = "") as out:
+            for chunk in itertools.chain(
+                    (_ics_header,), ics_events(date(y, 1, 1), date(y, 12, 31)),
+                    (_ics_footer,)):
+                out.write(chunk)
+                digest.update(chunk.encode("utf-8"))
+        if (regenerate and hashes.get(str(y)) == digest.hexdigest() and
+                os.path.exists(path)):
+            os.remove(path + ".tmp")
+            continue
+        os.replace(path + ".tmp", path)
+        hashes[str(y)] = digest.hexdigest()
+        written.append(y)
+    with open(manifest, "w") as f:
+        json.dump(hashes, f, indent = 1, sort_keys = True)
+    return written
+
+class ServiceTemplate:
+    """A service-sheet template, parsed once and then rendered for any
+    number of dates.  Placeholders are written as for str.format():
+        {date}             the date (e.g., {date:%A %d %B %Y})
+        {church_day}       the name of the day in the church calendar
+        {special}          "Special day" on special days, else empty
+        {collect_name}     the name of the first collect for the day
+        {collect}          its text
+        {special_collect}  the special day's collect, if there is one
+        {sunday}           the name of the week's collect
+        {sunday_collect}   the week's collect
+    """
+    fields = ("date", "church_day", "special", "collect_name", "collect",
+              "special_collect", "sunday", "sunday_collect")
+
+    def __init__(self, text):
+        from string import Formatter
+        self.parts = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if field is not None and field not in self.fields:
+                raise ValueError("unknown placeholder {%s} in template" % field)
+            self.parts.append((literal, field, spec or "", conversion))
+        # Find bad format specifications now, not part way through output.
+        sample = dict.fromkeys(self.fields, "")
+        sample["date"] = date(2000, 1, 1)
+        try:
+            self._render(sample)
+        except (ValueError, TypeError) as e:
+            raise ValueError("bad format in template: %s" % e)
+
+    def values(self, d):
+        "Returns the value of each placeholder for date d."
+        found = collect_for(d)
+        special = [(name, text) for name, text, is_special in found if is_special]
+        sunday = [(name, text) for name, text, is_special in found if not is_special]
+        first = (special or sunday or [("", "")])[0]
+        def text(name, collect):
+            if collect is None:
+                return "Please add collect for " + name + " to code"
+            return collect.strip()
+        return {
+            "date": d,
+            "church_day": church_date(d),
+            "special": "Special day" if special else "",
+            "collect_name": first[0],
+            "collect": text(*first),
+            "special_collect": text(*special[0]) if special else "",
+            "sunday": sunday[0][0] if sunday else "",
+            "sunday_collect": text(*sunday[0]) if sunday else "",
+        }
+
+    def render(self, d):
+        return self._render(self.values(d))
+
+    def _render(self, values):
+        out = []
+        for literal, field, spec, conversion in self.parts:
+            out.append(literal)
+            if field is not None:
+                value = values[field]
+                if conversion == "r":
+                    value = repr(value)
+                elif conversion is not None:
+                    value = str(value)
+                out.append(format(value, spec))
+        return "".join(out)
+
+_http_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found",
+                 405: "Method Not Allowed"}
+
+def _http_lookup(method, target, cache, cache_size):
+    "Answers one HTTP request; returns (status, JSON body as bytes)."
+    from urllib.parse import parse_qs, unquote, urlsplit
+    if method not in ("GET", "HEAD"):
+        return 405, b'{"error": "only GET is supported"}'
+    url = urlsplit(target)
+    body = cache.get(target)
+    if body is not None:
+        cache.move_to_end(target)
+        return 200, body
+    endpoint, _, arg = url.path.strip("/").partition("/")
+    if endpoint not in ("collect", "church_date"):
+        return 404, b'{"error": "use /collect/DATE or /church_date/DATE"}'
+    try:
+        day = parse_date(unquote(arg))
+    except (ValueError, OverflowError):
+        error = "Can't coerce %s to a date" % unquote(arg)
+        return 400, json.dumps({"error": error}).encode()
+    if endpoint == "collect":
+        record = collect_record(day)
+    else:
+        incspecials = parse_qs(url.query).get("specials", ["1"])[-1] != "0"
+        record = {"date": day.isoformat(),
+                  "church_day": church_date(day, incspecials)}
+    body = cache[target] = json.dumps(record).encode()
+    if len(cache) > cache_size:
+        cache.popitem(last = False)
+    return 200, body
+
+async def _serve_http(reader, writer, cache, cache_size):
+    "Serves HTTP/1.1 requests on one connection until it is closed."
+    try:
+        while True:
+            request = await reader.readline()
+            if not request.strip():
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if "content-length" in headers:
+                await reader.readexactly(int(headers["content-length"]))
+            try:
+                method, target, version = request.decode("latin-1").split()
+            except ValueError:
+                break
+            status, body = _http_lookup(method, target, cache, cache_size)
+            keep_alive = (version == "HTTP/1.1" and
+                          headers.get("connection", "").lower() != "close")
+            head = ("HTTP/1.1 %d %s\r\n"
+                    "Content-Type: application/json\r\n"
+                    "Content-Length: %d\r\n"
+                    "Connection: %s\r\n\r\n" %
+                    (status, _http_reasons[status], len(body),
+                     "keep-alive" if keep_alive else "close"))
+            writer.write(head.encode("latin-1"))
+            if method != "HEAD":
+                writer.write(body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def start_http_server(host = "127.0.0.1", port = 8080,
+                            cache_size = 4096):
+    """Starts an asyncio HTTP server answering
+        GET /collect/DATE             (as collect_record())
+        GET /church_date/DATE         (?specials=0 to leave out specials)
+    with JSON.  Up to cache_size responses are cached.
+    Returns the asyncio.Server."""
+    import asyncio
+    cache = OrderedDict()
+    def handler(reader, writer):
+        return _serve_http(reader, writer, cache, cache_size)
+    return await asyncio.start_server(handler, host, port)
+
+def default_socket_path():
+    """COLLECTS_SOCKET, or collects.sock in XDG_RUNTIME_DIR or else in
+    a directory of /tmp private to this user."""
+    if os.environ.get("COLLECTS_SOCKET"):
+        return os.environ["COLLECTS_SOCKET"]
+    directory = (os.environ.get("XDG_RUNTIME_DIR") or
+                 os.path.join("/tmp", "collects-%d" % os.getuid()))
+    return os.path.join(directory, "collects.sock")
+
+def _check_private_dir(directory):
+    """Raises OSError unless directory belongs to this user and no one
+    else can get into it, so a socket in it can be trusted."""
+    import stat
+    st = os.lstat(directory)
+    if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or
+            st.st_mode & 0o077):
+        raise OSError("%s is not a directory private to this user" % directory)
+
+# Commands the daemon runs itself; anything else, and anything that
+# reads standard input or collects stats, the client runs in-process.
+_daemon_commands = ("dates", "search", "specials")
+
+def run_captured(args):
+    """Runs main(args) with its output captured; returns (exit status,
+    standard output, standard error)."""
+    import io
+    from contextlib import redirect_stderr, redirect_stdout
+    out, err = io.StringIO(), io.StringIO()
+    status = 0
+    with redirect_stdout(out), redirect_stderr(err):
+        try:
+            status = main(args) or 0
+        except SystemExit as e:
+            if isinstance(e.code, int) or e.code is None:
+                status = e.code or 0
+            else:
+                err.write(str(e.code) + "\n")
+                status = 1
+    return status, out.getvalue(), err.getvalue()
+
+async def _serve_daemon(reader, writer):
+    "Answers one client: a JSON list of arguments in, a JSON reply out."
+    try:
+        args = json.loads(await reader.readline())
+        if (not isinstance(args, list) or "--stats" in args or "--stdin" in args
+            or args and args[0] in commands and args[0] not in _daemon_commands):
+            reply = {"fallback": True}
+        else:
+            status, out, err = run_captured([str(a) for a in args])
+            reply = {"status": status, "stdout": out, "stderr": err}
+        writer.write(json.dumps(reply).encode() + b"\n")
+        await writer.drain()
+    except (ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def start_daemon(path = None):
+    """Starts an asyncio server on the Unix socket path (by default
+    default_socket_path()) that runs collects.py command lines sent by
+    collects_client.py.  Returns the asyncio.Server."""
+    import asyncio, importlib, socket, stat
+    if path is None:
+        path = default_socket_path()
+        if not os.environ.get("COLLECTS_SOCKET"):
+            directory = os.path.dirname(path)
+            os.makedirs(directory, mode = 0o700, exist_ok = True)
+            _check_private_dir(directory)
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            raise OSError("%s exists and is not a socket" % path)
+        probe = socket.socket(socket.AF_UNIX)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.unlink(path) # left behind by a daemon that died
+        else:
+            raise OSError("a daemon is already listening on " + path)
+        finally:
+            probe.close()
+    # Warm up what the first lookups would otherwise pay for.
+    this_year = date.today().year
+    for y in range(this_year - 1, this_year + 2):
+        year_table(y)
+    try:
+        importlib.import_module("dateutil.parser")
+    except ImportError:
+        pass
+    return await asyncio.start_unix_server(_serve_daemon, path)
+
+def ics_main(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "collects.py ics",
+        description = "Write the Sundays and special days as an iCalendar feed.")
+    parser.add_argument("start", type = parse_date, help = "first date")
+    parser.add_argument("end", type = parse_date, help = "last date")
+    parser.add_argument("-o", "--output", help = "file to write (default: stdout)")
+    parser.add_argument("--split", metavar = "DIR",
+                        help = "write one YEAR.ics per year into DIR instead")
+    parser.add_argument("--regenerate", action = "store_true",
+                        help = "with --split, only rewrite years that changed")
+    opts = parser.parse_args(args)
+    if opts.split:
+        if ((opts.start.month, opts.start.day) != (1, 1) or
+                (opts.end.month, opts.end.day) != (12, 31)):
+            parser.error("--split writes whole years: START must be 1 January "
+                         "and END 31 December")
+        written = write_ics_years(opts.split, opts.start.year, opts.end.year,
+                                  opts.regenerate)
+        print("Wrote %d of %d years" %
+              (len(written), opts.end.year - opts.start.year + 1))
+    elif opts.output:
+        with open(opts.output, "w", encoding = "utf-8", newline = "") as out:
+            write_ics(out, opts.start, opts.end)
+    else:
+        out = _buffered_stdout()
+        try:
+            write_ics(out, opts.start, opts.end)
+        finally:
+            out.flush()
+
+def _offset_ranges(offsets):
+    "Groups sorted integers into 'a..b' runs."
+    runs = []
+    for n in offsets:
+        if runs and runs[-1][1] == n - 1:
+            runs[-1][1] = n
+        else:
+            runs.append([n, n])
+    return ", ".join(str(a) if a == b else "%d..%d" % (a, b) for a, b in runs)
+
+def audit_main(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "collects.py audit",
+        description = "Check every day in a range of years has a collect.")
+    parser.add_argument("--first-year", type = int, default = 1583)
+    parser.add_argument("--last-year", type = int, default = 9999)
+    opts = parser.parse_args(args)
+    if not 1583 <= opts.first_year <= opts.last_year <= 9999:
+        parser.error("years must be in order between 1583 and 9999")
+    report = audit_calendar(opts.first_year, opts.last_year)
+    print("%d days from %d to %d" % (report.days, opts.first_year, opts.last_year))
+    if report.missing:
+        print("\nChurch days with no collect:")
+        for name, first in report.missing.items():
+            print("  %s (first %s)" % (name, first))
+    if report.unreachable:
+        print("\nCollects no day looks up:")
+        for name in report.unreachable:
+            print("  " + name)
+    if report.fallback_days:
+        print("\n%d days have no church day name, at these days after Easter:" %
+              report.fallback_days)
+        print("  " + _offset_ranges(report.fallback_offsets))
+    if report.no_weekly_days:
+        print("\n%d days have no weekly collect" % report.no_weekly_days)
+    if report.missing or report.unreachable or report.fallback_days:
+        sys.exit(1)
+
+def search_main(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "collects.py search",
+        description = "Find the collects with a word or phrase in them.")
+    parser.add_argument("query", nargs = "+")
+    parser.add_argument("--words", action = "store_true",
+                        help = "match the words anywhere, not as a phrase")
+    opts = parser.parse_args(args)
+    for hit in search_collects(" ".join(opts.query), not opts.words):
+        line = hit.name
+        if hit.page:
+            line += " (" + hit.page + ")"
+        if hit.special:
+            line += " [special]"
+        print(line)
+
+def specials_main(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "collects.py specials",
+        description = "List the special days between two dates, or find the "
+                      "next or previous one.")
+    parser.add_argument("start", nargs = "?", type = parse_date,
+                        help = "first date (default: today)")
+    parser.add_argument("end", nargs = "?", type = parse_date,
+                        help = "last date (default: a year after the first)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--next", action = "store_true",
+                       help = "just the first special day after the date")
+    group.add_argument("--prev", action = "store_true",
+                       help = "just the last special day before the date")
+    opts = parser.parse_args(args)
+    start = opts.start or date.today()
+    if opts.next or opts.prev:
+        if opts.end:
+            parser.error("--next and --prev take only one date")
+        found = next_special(start) if opts.next else prev_special(start)
+        days = [found] if found else []
+    else:
+        end = opts.end
+        if end is None:
+            try:
+                end = start.replace(year = start.year + 1)
+            except ValueError:
+                # 29 February, or the year after is past 9999.
+                end = date.fromordinal(min(start.toordinal() + 365,
+                                           date.max.toordinal()))
+        days = specials_between(start, end)
+    out = _buffered_stdout()
+    try:
+        for d, name in days:
+            out.write("%s %s\n" % (d.isoformat(), name))
+    finally:
+        out.flush()
+
+def template_main(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "collects.py template",
+        description = "Fill in a service-sheet template for each date.")
+    parser.add_argument("template", help = "template file (see ServiceTemplate)")
+    parser.add_argument("dates", nargs = "*")
+    parser.add_argument("--stdin", action = "store_true",
+                        help = "read dates, one per line, from standard input")
+    parser.add_argument("-o", "--output",
+                        help = "write all the sheets to this file (default: stdout)")
+    parser.add_argument("--outdir",
+                        help = "write one file per date into this directory")
+    parser.add_argument("--name", default = "{date}.txt",
+                        help = "file name template for --outdir")
+    opts = parser.parse_args(args)
+    try:
+        with open(opts.template, encoding = "utf-8") as f:
+            template = ServiceTemplate(f.read())
+        name = ServiceTemplate(opts.name)
+    except OSError as e:
+        parser.error("can't read template: %s" % e)
+    except ValueError as e:
+        parser.error(str(e))
+    dates = opts.dates
+    if opts.stdin:
+        dates = itertools.chain(dates, (line.strip() for line in sys.stdin
+                                        if line.strip()))
+    def parsed():
+        for s in dates:
+            try:
+                yield parse_date(s)
+            except (ValueError, OverflowError):
+                sys.stderr.write("Can't coerce %s to a date\n" % s)
+    if opts.outdir:
+        os.makedirs(opts.outdir, exist_ok = True)
+        for d in parsed():
+            # Some church days have a / in their names.
+            path = os.path.join(opts.outdir, name.render(d).replace(os.sep, "-"))
+            with open(path, "w", encoding = "utf-8") as out:
+                out.write(template.render(d))
+        return
+    out = (open(opts.output, "w", encoding = "utf-8") if opts.output
+           else _buffered_stdout())
+    try:
+        for d in parsed():
+            out.write(template.render(d))
+    finally:
+        out.flush()
+        if opts.output:
+            out.close()
+
+def serve_main(args):
+    import argparse, asyncio
+    parser = argparse.ArgumentParser(prog = "collects.py serve",
+        description = "Answer collect lookups over HTTP.")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8080)
+    parser.add_argument("--cache-size", type = int, default = 4096,
+                        help = "how many responses to cache")
+    opts = parser.parse_args(args)
+    async def run():
+        server = await start_http_server(opts.host, opts.port,
+                                         opts.cache_size)
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+def daemon_main(args):
+    import argparse, asyncio
+    parser = argparse.ArgumentParser(prog = "collects.py daemon",
+        description = "Answer collects_client.py over a Unix socket.")
+    parser.add_argument("--socket",
+                        help = "socket path (default: %s)" % default_socket_path())
+    opts = parser.parse_args(args)
+    path = opts.socket or default_socket_path()
+    async def run():
+        try:
+            server = await start_daemon(opts.socket)
+        except OSError as e:
+            parser.error(str(e))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(path):
+                os.unlink(path)
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+def build_index_main(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "collects.py build-index",
+        description = "Precompute the calendar into an index file.")
+    parser.add_argument("--first-year", type = int, default = 1583)
+    parser.add_argument("--last-year", type = int, default = 9999)
+    parser.add_argument("-o", "--output", default = default_index_path())
+    opts = parser.parse_args(args)
+    if not 1 <= opts.first_year <= opts.last_year <= 9999:
+        parser.error("years must be in order between 1 and 9999")
+    build_index(opts.output, opts.first_year, opts.last_year)
+
+def dates_main(args):
+    import argparse
+    this_year = date.today().year
+    parser = argparse.ArgumentParser(prog = "collects.py dates",
+        description = "List the dates that have a given name in the church calendar.")
+    parser.add_argument("name", help = 'e.g., "Trinity 7" or "Lent 3"')
+    parser.add_argument("--first-year", type = int, default = this_year)
+    parser.add_argument("--last-year", type = int)
+    parser.add_argument("--no-specials", action = "store_true",
+                        help = "ignore special days")
+    parser.add_argument("--sundays", action = "store_true",
+                        help = "only list Sundays")
+    opts = parser.parse_args(args)
+    last_year = opts.last_year or min(opts.first_year + 9, 9999)
+    if not 1 <= opts.first_year <= last_year <= 9999:
+        parser.error("years must be in order between 1 and 9999")
+    out = _buffered_stdout()
+    try:
+        for d in dates_for(opts.name, opts.first_year, last_year,
+                           not opts.no_specials):
+            if not opts.sundays or d.weekday() == 6:
+                out.write(d.isoformat() + "\n")
+    finally:
+        out.flush()
+
+def export_main(args):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "collects.py export",
+        description = "Write the calendar for a span of years as CSV or JSON.")
+    parser.add_argument("first_year", type = int)
+    parser.add_argument("last_year", type = int)
+    parser.add_argument("--format", choices = ("csv", "json"), default = "csv")
+    parser.add_argument("-j", "--jobs", type = int,
+                        help = "worker processes (default: one per CPU)")
+    parser.add_argument("-o", "--output", help = "file to write (default: stdout)")
+    parser.add_argument("--cache", metavar = "DB",
+                        help = "keep computed years in this SQLite file")
+    opts = parser.parse_args(args)
+    if not 1 <= opts.first_year <= opts.last_year <= 9999:
+        parser.error("years must be in order between 1 and 9999")
+    if opts.cache:
+        rows = CalendarCache(opts.cache).rows(date(opts.first_year, 1, 1),
+                                              date(opts.last_year, 12, 31),
+                                              opts.jobs)
+    else:
+        rows = export_rows(opts.first_year, opts.last_year, opts.jobs)
+    if opts.output:
+        with open(opts.output, "w", newline = "", encoding = "utf-8") as out:
+            write_export(rows, out, opts.format)
+    else:
+        out = _buffered_stdout()
         try:
-            dx = parse(d)
-            day = date(dx.year, dx.month, dx.day)
-        except:
-            print("Can't coerce %s to a date\n" % d)
-            continue;
-        print_collect(day)
+            write_export(rows, out, opts.format)
+        finally:
+            out.flush()
+
+class Stats:
+    """Call counts and cumulative times recorded while instrumentation
+    is on (see enable_stats())."""
+
+    def __init__(self):
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.seconds = {}
+        self.hits = {}
+
+    def record(self, name, seconds, hit = None):
+        """Records one call to name taking seconds, and whether it was a
+        cache hit if that applies, and passes it on to the hooks."""
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        if hit:
+            self.hits[name] = self.hits.get(name, 0) + 1
+        for hook in self.hooks:
+            hook(name, seconds, hit)
+
+    def merge(self, calls, seconds, hits):
+        """Adds in the calls, seconds and hits of another Stats, e.g., one
+        from a worker process.  The hooks aren't called for them."""
+        for name, n in calls.items():
+            self.calls[name] = self.calls.get(name, 0) + n
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds[name]
+        for name, n in hits.items():
+            self.hits[name] = self.hits.get(name, 0) + n
+
+    def summary(self):
+        "Returns {name: {calls, seconds[, hit_rate]}} for everything recorded."
+        ret = {}
+        for name, calls in self.calls.items():
+            ret[name] = {"calls": calls, "seconds": self.seconds[name]}
+        if "year_table" in ret:
+            # Every miss builds a table.
+            calls = ret["year_table"]["calls"]
+            misses = self.calls.get("build_year_table", 0)
+            ret["year_table"]["hit_rate"] = (calls - misses) / calls
+        if "index" in ret:
+            calls = ret["index"]["calls"]
+            ret["index"]["hit_rate"] = self.hits.get("index", 0) / calls
+        return ret
+
+    def report(self, out = None):
+        out = out or sys.stderr
+        out.write("%-18s %10s %12s %9s\n" % ("", "calls", "seconds", "hit rate"))
+        for name, s in sorted(self.summary().items()):
+            rate = "%8.1f%%" % (100 * s["hit_rate"]) if "hit_rate" in s else ""
+            out.write("%-18s %10d %12.6f %9s\n" %
+                      (name, s["calls"], s["seconds"], rate))
+
+stats = Stats()
+
+def add_stats_hook(hook):
+    """Calls hook(name, seconds, hit) for every call recorded while
+    stats are enabled, e.g., to forward them to a metrics system."""
+    stats.hooks.append(hook)
+
+# Module functions that are timed, and the names they are recorded as.
+# Wrapping them only when asked keeps the hot paths free of overhead.
+_timed_functions = {
+    "calc_easter": "calc_easter",
+    "easter_ordinal": "easter_ordinal",
+    # church_date() and collect_for() and their ordinal forms all go
+    # through these.
+    "_church_name": "church_date",
+    "_collect_for": "collect_for",
+    "church_day": "church_day",
+    "iter_calendar": "iter_calendar",
+    "export_year": "export_year",
+    "parse_date": "parse_date",
+    "year_table": "year_table",
+    "_build_year_table": "build_year_table",
+}
+_untimed = {}
+
+def _timed(name, fn):
+    def timed(*args, **kwargs):
+        t = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stats.record(name, perf_counter() - t)
+    timed.__wrapped__ = fn
+    return timed
+
+def _timed_iter(name, fn):
+    "As _timed(), for a generator: each item counts as one call."
+    def timed(*args, **kwargs):
+        items = fn(*args, **kwargs)
+        while True:
+            t = perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            stats.record(name, perf_counter() - t)
+            yield item
+    timed.__wrapped__ = fn
+    return timed
+
+def _timed_lookup(self, n):
+    t = perf_counter()
+    names = _untimed["CalendarIndex.lookup"](self, n)
+    stats.record("index", perf_counter() - t, names is not None)
+    return names
+
+class _TimedWriter:
+    "Passes writes on to out, recording the time they take as output."
+
+    def __init__(self, out):
+        self._out = out
+
+    def write(self, text):
+        t = perf_counter()
+        self._out.write(text)
+        stats.record("output", perf_counter() - t)
+
+    def flush(self):
+        t = perf_counter()
+        self._out.flush()
+        stats.record("output", perf_counter() - t)
+
+def stats_enabled():
+    return bool(_untimed)
+
+def enable_stats():
+    "Starts recording calls and times in stats."
+    import inspect
+    if stats_enabled():
+        return
+    module = globals()
+    for fn, name in _timed_functions.items():
+        _untimed[fn] = module[fn]
+        if inspect.isgeneratorfunction(module[fn]):
+            module[fn] = _timed_iter(name, module[fn])
+        else:
+            module[fn] = _timed(name, module[fn])
+    _untimed["CalendarIndex.lookup"] = CalendarIndex.lookup
+    CalendarIndex.lookup = _timed_lookup
+
+def disable_stats():
+    "Stops recording; what has been recorded stays in stats."
+    module = globals()
+    for fn in _timed_functions:
+        if fn in _untimed:
+            module[fn] = _untimed.pop(fn)
+    if "CalendarIndex.lookup" in _untimed:
+        CalendarIndex.lookup = _untimed.pop("CalendarIndex.lookup")
+
+# Subcommands: collects.py NAME ARGS...
+commands = {
+    "audit": audit_main,
+    "build-index": build_index_main,
+    "daemon": daemon_main,
+    "dates": dates_main,
+    "export": export_main,
+    "ics": ics_main,
+    "search": search_main,
+    "serve": serve_main,
+    "specials": specials_main,
+    "template": template_main,
+}
+
+def main(args = None):
+    if args is None:
+        args = sys.argv[1:]
+    if "--stats" in args:
+        args = [a for a in args if a != "--stats"]
+        enable_stats()
+        atexit.register(stats.report)
+    if not args:
+        # Print next Sunday's collect.
+        out = _buffered_stdout()
+        print_collect(next_sunday(), out)
+        out.flush()
+        return
+    if args[0] in commands:
+        return commands[args[0]](args[1:])
+    # argparse is slow to import, so only pay for it when there are
+    # arguments to parse.
+    import argparse
+    parser = argparse.ArgumentParser(
+        description = "Print the collect for each date, or for next Sunday.")
+    parser.add_argument("dates", nargs = "*", help = "dates to look up")
+    parser.add_argument("--stdin", action = "store_true",
+                        help = "read dates, one per line, from standard input")
+    parser.add_argument("--json", action = "store_true",
+                        help = "write newline-delimited JSON")
+    opts = parser.parse_args(args)
+    dates = opts.dates
+    if not dates and not opts.stdin:
+        dates = [next_sunday().isoformat()]
+    out = _buffered_stdout()
+    try:
+        write_collects(dates, out, opts.json)
+        if opts.stdin:
+            lines = (line.strip() for line in sys.stdin if line.strip())
+            write_collects(lines, out, opts.json, flush = sys.stdin.isatty())
+    finally:
+        out.flush()
+
+if __name__ == "__main__":
+    main()
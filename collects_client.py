@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# This code is licensed under the Gnu Public License
+# version 3 or later.
+#
+# Thin client for "collects.py daemon": takes the same arguments as
+# collects.py, sends them to the daemon over its Unix socket and prints
+# the reply.  If no daemon is running, or the daemon sends the command
+# back, it runs collects.py in this process instead.
+#
+# Only the standard library's json, os, socket, stat and sys are loaded on
+# the fast path, so start-up costs little more than the interpreter.
+#
+import json
+import os
+import socket
+import stat
+import sys
+
+def socket_path():
+    """As collects.default_socket_path(), or None if the default
+    directory isn't private to this user, as then anyone could have
+    made the socket in it."""
+    if os.environ.get("COLLECTS_SOCKET"):
+        return os.environ["COLLECTS_SOCKET"]
+    directory = (os.environ.get("XDG_RUNTIME_DIR") or
+                 os.path.join("/tmp", "collects-%d" % os.getuid()))
+    try:
+        st = os.lstat(directory)
+    except OSError:
+        return None
+    if (not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or
+            st.st_mode & 0o077):
+        return None
+    return os.path.join(directory, "collects.sock")
+
+def ask(args, path):
+    "Returns the daemon's reply to args, or None if there's no daemon."
+    if path is None:
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX) as s:
+            s.connect(path)
+            s.sendall(json.dumps(args).encode() + b"\n")
+            chunks = []
+            while True:
+                chunk = s.recv(1 << 16)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return json.loads(b"".join(chunks))
+    except (OSError, ValueError):
+        return None
+
+def main():
+    args = sys.argv[1:]
+    reply = ask(args, socket_path())
+    if reply is None or reply.get("fallback"):
+        import collects
+        sys.exit(collects.main(args))
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    sys.exit(reply["status"])
+
+if __name__ == "__main__":
+    main()
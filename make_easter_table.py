@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# This code is licensed under the Gnu Public License
+# version 3 or later.
+#
+# Generates easter.dat, the table of Easter dates used by
+# collects.easter_ordinal(), from the Anonymous Gregorian algorithm.
+# test_collects.py checks the shipped table against the algorithm.
+#
+import argparse
+from array import array
+from datetime import date
+from os import path
+import struct
+
+import collects
+
+TABLE = path.join(path.dirname(path.abspath(__file__)), "easter.dat")
+
+def easter_days(year):
+    "Days from 1 January to Easter, by the algorithm."
+    month, day = collects._easter_month_day(year)
+    return (date(year, month, day) - date(year, 1, 1)).days
+
+def make_table(first_year, last_year):
+    return array('B', (easter_days(y) for y in range(first_year, last_year + 1)))
+
+def write_table(first_year, last_year):
+    with open(TABLE, "wb") as f:
+        f.write(struct.pack("<H", first_year))
+        make_table(first_year, last_year).tofile(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description = "Generate the Easter table easter.dat.")
+    parser.add_argument("--first-year", type = int, default = 1583)
+    parser.add_argument("--last-year", type = int, default = 9999)
+    opts = parser.parse_args()
+    write_table(opts.first_year, opts.last_year)
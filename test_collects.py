@@ -0,0 +1,295 @@
+# This code is licensed under the Gnu Public License
+# version 3 or later.
+#
+# Tests for collects.py; run with pytest.
+#
+from datetime import date, timedelta
+
+import pytest
+
+import collects
+
+# The calendar as it was worked out before the rule tables, kept to
+# check them against.
+def _old_calc_easter(year):
+    a = year % 19
+    b = year // 100
+    c = year % 100
+    d = (19 * a + b - b // 4 - ((b - (b + 8) // 25 + 1) // 3) + 15) % 30
+    e = (32 + 2 * (b % 4) + 2 * (c // 4) - d - (c % 4)) % 7
+    f = d + e - 7 * ((a + 11 * d + 22 * e) // 451) + 114
+    return date(year, f // 31, f % 31 + 1)
+
+def _old_church_date(d, incspecials = True):
+    x = str(d.month) + '/' + str(d.day)
+    if incspecials and x in collects.specials:
+        return collects.specials[x]
+    y = d.year
+    days = (d - _old_calc_easter(y)).days
+    if days < -63:
+        epiphany = date(y, 1, 6)
+        if d < epiphany:
+            return "Christmas 2"
+        return "Epiphany " + str(1 + ((d - epiphany).days // 7))
+    if days > 56:
+        christmas = date(y, 12, 25)
+        if christmas < d:
+            return "Christmas 1"
+        weeks_before_Christmas = (((christmas - d).days + 6) // 7)
+        if weeks_before_Christmas < 6:
+            return collects.christmas_rel[weeks_before_Christmas - 1]
+        return "Trinity " + str((days - 56) // 7)
+    if days in collects.easter_rel:
+        return collects.easter_rel[days]
+    return str(d)
+
+def _old_collect_for(dd):
+    ret = []
+    sun = dd - timedelta(days = dd.weekday()) if dd.weekday() != 6 else dd
+    day = _old_church_date(dd)
+    if day in collects.special_collects:
+        ret.append((day, collects.special_collects[day], True))
+    nonspecial = _old_church_date(sun, incspecials = False)
+    if nonspecial in collects.collects:
+        ret.append((nonspecial, collects.collects[nonspecial], False))
+    return ret
+
+# Every 97th year across the Gregorian range, plus the years around now.
+_check_years = sorted(set(range(1583, 10000, 97)) | set(range(1999, 2031)) |
+                      {1600, 1700, 1900, 2000, 9999})
+
+def test_calc_easter_array_matches_calc_easter():
+    np = pytest.importorskip("numpy")
+    years = np.arange(1583, 10000)
+    easters = collects.calc_easter_array(years)
+    ordinals = collects.calc_easter_array(years, ordinals = True)
+    for y, easter, n in zip(range(1583, 10000), easters.tolist(), ordinals.tolist()):
+        assert easter == collects.calc_easter(y)
+        assert n == collects.calc_easter(y).toordinal()
+
+def test_bad_index_falls_back(tmp_path, monkeypatch):
+    good = str(tmp_path / "good.idx")
+    collects.build_index(good, 2020, 2022)
+    with open(good, "rb") as f:
+        data = f.read()
+    for name, content in (("short.idx", data[:20]),
+                          ("truncated.idx", data[:-10])):
+        path = tmp_path / name
+        path.write_bytes(content)
+        with pytest.raises(ValueError):
+            collects.CalendarIndex(str(path))
+        monkeypatch.setenv("COLLECTS_INDEX", str(path))
+        monkeypatch.setattr(collects, "_index_loaded", False)
+        assert collects.calendar_index() is None
+        assert collects.church_date(date(2021, 6, 6)) == "Trinity 1"
+    collects.use_calendar_index(None)
+
+def test_collect_store_keeps_none():
+    store = collects.CollectStore("collects")
+    store["X"] = None
+    assert "X" in store
+    assert store["X"] is None
+    assert store.get("X", "default") is None
+    assert store["Trinity 1"] == collects.collects["Trinity 1"]
+    with pytest.raises(KeyError):
+        store["no such day"]
+
+def test_easter_table_matches_algorithm():
+    import make_easter_table
+    table = collects._load_easter_table()
+    first = collects._easter_table_first
+    assert (first, first + len(table) - 1) == (1583, 9999)
+    assert table == make_easter_table.make_table(1583, 9999)
+    for y in (1, 1582, 1583, 2021, 9999):
+        month, day = collects._easter_month_day(y)
+        assert collects.calc_easter(y) == date(y, month, day)
+
+def _year_days(y):
+    return [date.fromordinal(n) for n in range(date(y, 1, 1).toordinal(),
+                                               date(y, 12, 31).toordinal() + 1)]
+
+def test_calendar_matches_old_calculation():
+    collects.use_calendar_index(None)
+    for y in _check_years:
+        for d in _year_days(y):
+            assert collects.church_date(d) == _old_church_date(d), d
+            assert (collects.church_date(d, incspecials = False) ==
+                    _old_church_date(d, incspecials = False)), d
+            assert collects.collect_for(d) == _old_collect_for(d), d
+
+def test_dates_for_matches_old_calculation():
+    names = ["Trinity 7", "Epiphany 3", "Easter Day", "Advent 1",
+             "Christmas 1", "Christ the King", "St Luke", "Lent 2"]
+    for y in _check_years[::4]:
+        days = _year_days(y)
+        for incspecials in (True, False):
+            for name in names:
+                expected = [d for d in days
+                            if _old_church_date(d, incspecials) == name]
+                assert list(collects.dates_for(name, y, y, incspecials)) == expected
+
+def test_page_references():
+    assert collects._page_refs("(AAPB p181)\n(AAPB p 256) AAPB 227 (APPB p208)") == [
+        "AAPB p181", "AAPB p256", "AAPB p227", "AAPB p208"]
+    pages = {hit.name: hit.page for hit in collects.search_collects("Lord", False)}
+    assert pages["Trinity 11"] == "AAPB p256"
+    assert pages["Trinity 2"] == "AAPB p227"
+    assert pages["Easter Eve"] == "AAPB p208"
+
+def test_church_day_matches_church_date():
+    collects.use_calendar_index(None)
+    for entry in collects.iter_calendar(date(2020, 1, 1), date(2022, 12, 31)):
+        d, day = entry.date, entry.church_day
+        assert str(day) == day == collects.church_date(d)
+        assert collects.church_day(d) is day or day.code == 0
+        assert ((day.special is not None) ==
+                ("%d/%d" % (d.month, d.day) in collects.specials))
+    day = collects.church_day(date(2021, 7, 18))
+    assert (day.season, day.week) == ("Trinity", 7)
+    assert collects.collects[day] == collects.collects["Trinity 7"]
+
+def test_stats_count_lookups():
+    collects.enable_stats()
+    try:
+        before = collects.stats.summary()
+        collects.collect_for(date(2021, 6, 9))
+        collects.church_date_ordinal(date(2021, 6, 9).toordinal())
+        after = collects.stats.summary()
+    finally:
+        collects.disable_stats()
+    def calls(summary, name):
+        return summary.get(name, {}).get("calls", 0)
+    assert calls(after, "collect_for") - calls(before, "collect_for") == 1
+    assert calls(after, "church_date") - calls(before, "church_date") == 3
+
+def test_parse_date():
+    parse = collects.parse_date
+    assert parse("2021-06-06") == parse("2021-6-6") == date(2021, 6, 6)
+    assert parse(" 20210404 ") == date(2021, 4, 4)
+    assert parse("3/4/2021") == date(2021, 4, 3)
+    for bad in ("3/14/2021", "2021-02-30", "20211301"):
+        with pytest.raises(ValueError):
+            parse(bad)
+    pytest.importorskip("dateutil")
+    assert parse("3/4/21") == date(2021, 4, 3)
+    assert parse("June 6 2021") == date(2021, 6, 6)
+    with pytest.raises((ValueError, OverflowError)):
+        parse("bogus")
+
+def test_export_skips_missing_texts(monkeypatch):
+    monkeypatch.setitem(collects.collects, "Trinity 7", None)
+    rows = {row[0]: row for row in collects.export_year(2021)}
+    assert rows["2021-07-18"][3:] == (["Trinity 7"], [])
+
+def test_stats_cover_export_workers():
+    collects.enable_stats()
+    try:
+        collects.stats.reset()
+        rows = list(collects.export_rows(2020, 2021, jobs = 2))
+        summary = collects.stats.summary()
+    finally:
+        collects.disable_stats()
+        collects.stats.reset()
+    assert len(rows) == 731
+    assert summary["export_year"]["calls"] == 2
+    assert summary["iter_calendar"]["calls"] == 731
+
+def test_search_skips_missing_texts(monkeypatch):
+    monkeypatch.setitem(collects.special_collects, "St Luke", None)
+    monkeypatch.setattr(collects, "_search_index", None)
+    hits = collects.search_collects("armour of light")
+    assert [hit.name for hit in hits] == ["Advent 1"]
+    monkeypatch.setattr(collects, "_search_index", None)
+
+def test_cache_drops_rows_from_other_tables(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.db")
+    cache = collects.CalendarCache(path)
+    start, end = date(2021, 3, 1), date(2021, 3, 31)
+    assert list(cache.rows(start, end, jobs = 1)) == [
+        row for row in collects.export_year(2021) if row[0].startswith("2021-03")]
+    old = cache.digest
+    cache.close()
+
+    monkeypatch.setitem(collects.specials, "3/10", "Test Day")
+    collects.clear_year_cache()
+    try:
+        cache = collects.CalendarCache(path)
+        assert cache.digest != old
+        rows = {row[0]: row for row in cache.rows(start, end, jobs = 1)}
+        assert rows["2021-03-10"][1] == "Test Day"
+        assert cache.db.execute("SELECT COUNT(*) FROM calendar WHERE digest = ?",
+                                (old,)).fetchone() == (0,)
+        cache.close()
+    finally:
+        monkeypatch.undo()
+        collects.clear_year_cache()
+
+def test_ics_skips_missing_texts(monkeypatch):
+    monkeypatch.setitem(collects.collects, "Trinity 7", None)
+    events = list(collects.ics_events(date(2021, 7, 18), date(2021, 7, 18)))
+    assert len(events) == 1 and "SUMMARY:Trinity 7" in events[0]
+
+def test_template_checks_formats_and_missing_texts(monkeypatch):
+    with pytest.raises(ValueError):
+        collects.ServiceTemplate("{collect:>5d}")
+    template = collects.ServiceTemplate("{date:%d %B} {sunday}: {sunday_collect}")
+    monkeypatch.setitem(collects.collects, "Trinity 7", None)
+    assert (template.render(date(2021, 7, 18)) ==
+            "18 July Trinity 7: Please add collect for Trinity 7 to code")
+
+def test_collect_for_reads_weekly_column_from_index(tmp_path):
+    path = str(tmp_path / "t.idx")
+    collects.build_index(path, 2020, 2022)
+    days = [date(2019, 12, 30) + timedelta(days = i) for i in range(3 * 366)]
+    collects.use_calendar_index(None)
+    expected = [collects.collect_for(d) for d in days]
+    collects.use_calendar_index(path)
+    try:
+        assert [collects.collect_for(d) for d in days] == expected
+        collects.enable_stats()
+        collects.stats.reset()
+        collects.collect_for(date(2021, 6, 9))
+        assert collects.stats.summary()["index"]["calls"] == 1
+    finally:
+        collects.disable_stats()
+        collects.stats.reset()
+        collects.use_calendar_index(None)
+
+def _scan_specials(first, last):
+    "The special days from first to last, found by looking at every day."
+    found = []
+    for n in range(first.toordinal(), last.toordinal() + 1):
+        d = date.fromordinal(n)
+        name = collects.specials.get("%d/%d" % (d.month, d.day))
+        if name is not None:
+            found.append((d, name))
+    return found
+
+@pytest.mark.parametrize("table", [None, {"2/29": "Leap Day"},
+                                   {"2/29": "Leap Day", "3/1": "March 1"}])
+def test_specials_index_matches_scan(table, monkeypatch):
+    if table is not None:
+        monkeypatch.setattr(collects, "specials", table)
+    collects.clear_year_cache()
+    try:
+        first, last = date(1888, 1, 1), date(1916, 12, 31)
+        scan = _scan_specials(first, last)
+        assert list(collects.specials_between(first, last)) == scan
+        starts = [date(1896, 2, 28), date(1896, 2, 29), date(1899, 12, 31),
+                  date(1900, 3, 1), date(1904, 3, 1), date(1912, 12, 31)]
+        starts += [first + timedelta(days = i) for i in range(0, 10000, 37)]
+        for d in starts:
+            after = [s for s in scan if s[0] > d]
+            before = [s for s in scan if s[0] < d]
+            # The scan covers every day between, so these are the true
+            # next and previous special days.
+            if after:
+                assert collects.next_special(d) == after[0], d
+            if before:
+                assert collects.prev_special(d) == before[-1], d
+            end = min(d + timedelta(days = 100), last)
+            assert (list(collects.specials_between(d, end)) ==
+                    [s for s in scan if d <= s[0] <= end])
+    finally:
+        monkeypatch.undo()
+        collects.clear_year_cache()